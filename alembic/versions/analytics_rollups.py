@@ -0,0 +1,47 @@
+"""analytics rollups
+
+Revision ID: 2b7c4e9d1f03
+Revises: 1234567890ab
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '2b7c4e9d1f03'
+down_revision = '1234567890ab'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'engagement_rollups',
+        sa.Column('granularity', sa.String(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('engagement_type', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('granularity', 'bucket_start', 'engagement_type')
+    )
+
+    op.create_table(
+        'pult_score_snapshots',
+        sa.Column('day', sa.DateTime(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('pult_score', sa.Float(), nullable=True),
+        sa.Column('last_processed', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('day', 'user_id')
+    )
+
+    op.create_table(
+        'rollup_checkpoints',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('last_engagement_id', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+def downgrade():
+    op.drop_table('rollup_checkpoints')
+    op.drop_table('pult_score_snapshots')
+    op.drop_table('engagement_rollups')
@@ -0,0 +1,20 @@
+"""collection checkpoints
+
+Revision ID: 4d9e6a1b3f25
+Revises: 3c8d5f0a2e14
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '4d9e6a1b3f25'
+down_revision = '3c8d5f0a2e14'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('users', sa.Column('collection_checkpoints', sa.JSON(), nullable=True))
+
+def downgrade():
+    op.drop_column('users', 'collection_checkpoints')
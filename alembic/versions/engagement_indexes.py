@@ -0,0 +1,177 @@
+"""engagement indexes and optional partitioning
+
+Revision ID: 3c8d5f0a2e14
+Revises: 2b7c4e9d1f03
+Create Date: 2026-10-17 00:00:00.000000
+
+Set ENGAGEMENTS_PARTITIONED=true to rebuild engagements as a table
+range-partitioned by month on created_at. Postgres requires unique
+constraints on a partitioned table to include the partition key, so in
+that mode the primary key is (id, created_at), the uniqueness constraint
+also covers created_at, and created_at becomes NOT NULL.
+
+Otherwise the indexes are built concurrently on the live table. Pause
+ingest while this runs: a duplicate written during the unique index
+build leaves the index invalid, and the migration then has to drop it,
+deduplicate again and rebuild, giving up after a few attempts.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+from core.partitioning.engagements import ensure_partitions, is_partitioned
+import os
+
+revision = '3c8d5f0a2e14'
+down_revision = '2b7c4e9d1f03'
+branch_labels = None
+depends_on = None
+
+UNIQUE_INDEX_ATTEMPTS = 3
+
+def _partitioning_enabled():
+    return os.getenv("ENGAGEMENTS_PARTITIONED", "false").lower() == "true"
+
+def upgrade():
+    if _partitioning_enabled():
+        _upgrade_partitioned()
+        return
+
+    # Build indexes without blocking writes to the table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_engagements_user_id_created_at',
+            'engagements',
+            ['user_id', 'created_at'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_engagements_created_at_engagement_type',
+            'engagements',
+            ['created_at', 'engagement_type'],
+            postgresql_concurrently=True
+        )
+        _create_unique_index()
+
+    op.execute("""
+        ALTER TABLE engagements
+        ADD CONSTRAINT uq_engagements_user_tweet_type
+        UNIQUE USING INDEX uq_engagements_user_tweet_type
+    """)
+
+def _dedupe_engagements():
+    """Keep only the first copy of each engagement"""
+    op.execute("""
+        DELETE FROM engagements a USING engagements b
+        WHERE a.user_id = b.user_id
+          AND a.tweet_id = b.tweet_id
+          AND a.engagement_type = b.engagement_type
+          AND a.id > b.id
+    """)
+
+def _create_unique_index():
+    """Build the uniqueness index concurrently, retrying if it ends up invalid"""
+    conn = op.get_bind()
+    for _ in range(UNIQUE_INDEX_ATTEMPTS):
+        _dedupe_engagements()
+        try:
+            op.create_index(
+                'uq_engagements_user_tweet_type',
+                'engagements',
+                ['user_id', 'tweet_id', 'engagement_type'],
+                unique=True,
+                postgresql_concurrently=True
+            )
+        except sa.exc.IntegrityError:
+            # A duplicate was written during the build
+            pass
+        valid = conn.execute(sa.text(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('uq_engagements_user_tweet_type')"
+        )).scalar()
+        if valid:
+            return
+        # A failed concurrent build leaves an invalid index behind
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS uq_engagements_user_tweet_type")
+    raise RuntimeError(
+        f"uq_engagements_user_tweet_type was still invalid after {UNIQUE_INDEX_ATTEMPTS} attempts; "
+        "pause ingest and rerun the migration"
+    )
+
+def _upgrade_partitioned():
+    conn = op.get_bind()
+
+    # Keep the id sequence when the old table is dropped
+    op.execute("ALTER TABLE engagements RENAME TO engagements_legacy")
+    op.execute("ALTER TABLE engagements_legacy RENAME CONSTRAINT engagements_pkey TO engagements_legacy_pkey")
+    op.execute("ALTER SEQUENCE engagements_id_seq OWNED BY NONE")
+
+    op.execute("""
+        CREATE TABLE engagements (
+            id INTEGER NOT NULL DEFAULT nextval('engagements_id_seq'),
+            user_id INTEGER REFERENCES users (id),
+            tweet_id VARCHAR,
+            engagement_type VARCHAR,
+            sentiment_score DOUBLE PRECISION,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            CONSTRAINT engagements_pkey PRIMARY KEY (id, created_at),
+            CONSTRAINT uq_engagements_user_tweet_type
+                UNIQUE (user_id, tweet_id, engagement_type, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("ALTER SEQUENCE engagements_id_seq OWNED BY engagements.id")
+
+    op.create_index(
+        'ix_engagements_user_id_created_at',
+        'engagements',
+        ['user_id', 'created_at']
+    )
+    op.create_index(
+        'ix_engagements_created_at_engagement_type',
+        'engagements',
+        ['created_at', 'engagement_type']
+    )
+
+    oldest = conn.execute(sa.text(
+        "SELECT min(created_at) FROM engagements_legacy"
+    )).scalar()
+    ensure_partitions(conn, oldest or datetime.utcnow())
+    op.execute("CREATE TABLE engagements_default PARTITION OF engagements DEFAULT")
+
+    # Copy one row per engagement; rows without a timestamp get the migration time
+    op.execute("""
+        INSERT INTO engagements (id, user_id, tweet_id, engagement_type, sentiment_score, created_at)
+        SELECT DISTINCT ON (user_id, tweet_id, engagement_type)
+            id, user_id, tweet_id, engagement_type, sentiment_score,
+            COALESCE(created_at, now() AT TIME ZONE 'utc')
+        FROM engagements_legacy
+        ORDER BY user_id, tweet_id, engagement_type, id
+    """)
+    op.execute("DROP TABLE engagements_legacy")
+
+def downgrade():
+    if is_partitioned(op.get_bind()):
+        op.execute("ALTER TABLE engagements RENAME TO engagements_partitioned")
+        op.execute("ALTER TABLE engagements_partitioned RENAME CONSTRAINT engagements_pkey TO engagements_partitioned_pkey")
+        op.execute("ALTER TABLE engagements_partitioned RENAME CONSTRAINT uq_engagements_user_tweet_type TO uq_engagements_partitioned_user_tweet_type")
+        op.execute("ALTER INDEX ix_engagements_user_id_created_at RENAME TO ix_engagements_partitioned_user_id_created_at")
+        op.execute("ALTER INDEX ix_engagements_created_at_engagement_type RENAME TO ix_engagements_partitioned_created_at_engagement_type")
+        op.execute("ALTER SEQUENCE engagements_id_seq OWNED BY NONE")
+        op.execute("""
+            CREATE TABLE engagements (
+                id INTEGER NOT NULL DEFAULT nextval('engagements_id_seq'),
+                user_id INTEGER REFERENCES users (id),
+                tweet_id VARCHAR,
+                engagement_type VARCHAR,
+                sentiment_score DOUBLE PRECISION,
+                created_at TIMESTAMP WITHOUT TIME ZONE,
+                CONSTRAINT engagements_pkey PRIMARY KEY (id)
+            )
+        """)
+        op.execute("ALTER SEQUENCE engagements_id_seq OWNED BY engagements.id")
+        op.execute("INSERT INTO engagements SELECT * FROM engagements_partitioned")
+        op.execute("DROP TABLE engagements_partitioned CASCADE")
+        return
+
+    op.drop_constraint('uq_engagements_user_tweet_type', 'engagements', type_='unique')
+    op.drop_index('ix_engagements_created_at_engagement_type', table_name='engagements')
+    op.drop_index('ix_engagements_user_id_created_at', table_name='engagements')
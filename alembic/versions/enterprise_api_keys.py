@@ -0,0 +1,32 @@
+"""enterprise api keys
+
+Revision ID: 5e0f7b2c4a36
+Revises: 4d9e6a1b3f25
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '5e0f7b2c4a36'
+down_revision = '4d9e6a1b3f25'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'enterprise_api_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('key_hash', sa.String(length=64), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_enterprise_api_keys_key_hash', 'enterprise_api_keys', ['key_hash'], unique=True)
+
+def downgrade():
+    op.drop_index('ix_enterprise_api_keys_key_hash', table_name='enterprise_api_keys')
+    op.drop_table('enterprise_api_keys')
@@ -0,0 +1,240 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import and_, delete, func, literal, or_, select, DateTime
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.user import User
+from models.engagement import Engagement
+from models.analytics import EngagementRollup, ScoreSnapshot, RollupCheckpoint
+import os
+
+CHECKPOINT_NAME = "engagement_rollups"
+# Highest id seen by an earlier run, folded once it has had time to settle
+PENDING_CHECKPOINT_NAME = "engagement_rollups:pending"
+GRANULARITIES = ("hour", "day")
+
+# Hourly rows are only needed for the partial first day of a window
+HOURLY_RETENTION_DAYS = 366
+
+class AnalyticsRollup:
+    """Maintains per-type engagement counts by hour and day, and daily score snapshots"""
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        # Longest an ingest transaction may stay open after taking its ids
+        self.settle_seconds = float(os.getenv("ROLLUP_SETTLE_SECONDS", 300))
+
+    async def update_rollups(self) -> int:
+        """Fold engagements added before the previous run into the rollups.
+
+        Ids are taken when rows are inserted but become visible on commit,
+        so a lower id can appear after a higher one was folded. Each run
+        therefore only folds up to the highest id an earlier run saw at
+        least settle_seconds ago; newer rows are counted from the table.
+        """
+        now = datetime.utcnow()
+
+        # Make sure the checkpoints exist, then lock them so concurrent
+        # schedulers on other workers cannot fold the same rows twice
+        await self.db.execute(
+            insert(RollupCheckpoint).values([
+                {"name": name, "last_engagement_id": 0, "updated_at": now}
+                for name in (CHECKPOINT_NAME, PENDING_CHECKPOINT_NAME)
+            ]).on_conflict_do_nothing(index_elements=["name"])
+        )
+        checkpoints = {
+            checkpoint.name: checkpoint
+            for checkpoint in (await self.db.execute(
+                select(RollupCheckpoint).where(
+                    RollupCheckpoint.name.in_([CHECKPOINT_NAME, PENDING_CHECKPOINT_NAME])
+                ).with_for_update()
+            )).scalars()
+        }
+        checkpoint = checkpoints[CHECKPOINT_NAME]
+        pending = checkpoints[PENDING_CHECKPOINT_NAME]
+
+        last_id = checkpoint.last_engagement_id
+        settled_id = last_id
+        if pending.last_engagement_id > last_id and pending.updated_at <= now - timedelta(seconds=self.settle_seconds):
+            settled_id = pending.last_engagement_id
+
+        # Start the clock on every id taken so far once nothing else is pending
+        max_id = (await self.db.execute(select(func.max(Engagement.id)))).scalar()
+        if pending.last_engagement_id <= settled_id and max_id is not None and max_id > settled_id:
+            pending.last_engagement_id = max_id
+            pending.updated_at = now
+
+        if settled_id <= last_id:
+            await self.db.commit()
+            return 0
+
+        engagement_type = func.coalesce(Engagement.engagement_type, "unknown")
+        folded = 0
+        for granularity in GRANULARITIES:
+            bucket_start = func.date_trunc(granularity, Engagement.created_at, type_=DateTime)
+            rows = (await self.db.execute(
+                select(
+                    bucket_start,
+                    engagement_type,
+                    func.count(Engagement.id)
+                ).where(
+                    Engagement.id > last_id,
+                    Engagement.id <= settled_id,
+                    Engagement.created_at.isnot(None)
+                ).group_by(
+                    bucket_start,
+                    engagement_type
+                )
+            )).all()
+            if not rows:
+                continue
+
+            stmt = insert(EngagementRollup).values([
+                {
+                    "granularity": granularity,
+                    "bucket_start": row[0],
+                    "engagement_type": row[1],
+                    "count": row[2]
+                } for row in rows
+            ])
+            await self.db.execute(stmt.on_conflict_do_update(
+                index_elements=["granularity", "bucket_start", "engagement_type"],
+                set_={"count": EngagementRollup.count + stmt.excluded["count"]}
+            ))
+            folded = sum(row[2] for row in rows)
+
+        await self.db.execute(
+            delete(EngagementRollup).where(
+                EngagementRollup.granularity == "hour",
+                EngagementRollup.bucket_start < now - timedelta(days=HOURLY_RETENTION_DAYS)
+            )
+        )
+
+        checkpoint.last_engagement_id = settled_id
+        checkpoint.updated_at = now
+        await self.db.commit()
+
+        return folded
+
+    async def clip_expired(self, default_days: int, days_by_type: Dict[str, int]):
+        """Drop rollup buckets that retention has already emptied.
+
+        Retention deletes rows but never decrements the rollups. Buckets
+        that start before the one holding a type's cutoff are removed. The
+        boundary bucket is kept, so it can still include up to one day (or
+        one hour) of deleted rows.
+        """
+        now = datetime.utcnow()
+        for granularity in GRANULARITIES:
+            for engagement_type, days in days_by_type.items():
+                await self.db.execute(delete(EngagementRollup).where(
+                    EngagementRollup.granularity == granularity,
+                    EngagementRollup.engagement_type == engagement_type,
+                    EngagementRollup.bucket_start < self._bucket_start(granularity, now - timedelta(days=days))
+                ))
+            await self.db.execute(delete(EngagementRollup).where(
+                EngagementRollup.granularity == granularity,
+                EngagementRollup.engagement_type.notin_(list(days_by_type)),
+                EngagementRollup.bucket_start < self._bucket_start(granularity, now - timedelta(days=default_days))
+            ))
+        await self.db.commit()
+
+    def _bucket_start(self, granularity: str, timestamp: datetime) -> datetime:
+        timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+        if granularity == "day":
+            timestamp = timestamp.replace(hour=0)
+        return timestamp
+
+    async def snapshot_scores(self):
+        """Record today's score for every user processed today"""
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        stmt = insert(ScoreSnapshot).from_select(
+            ["day", "user_id", "pult_score", "last_processed"],
+            select(
+                literal(today, DateTime),
+                User.id,
+                User.pult_score,
+                User.last_processed
+            ).where(
+                User.last_processed >= today
+            )
+        )
+        await self.db.execute(stmt.on_conflict_do_update(
+            index_elements=["day", "user_id"],
+            set_={
+                "pult_score": stmt.excluded.pult_score,
+                "last_processed": stmt.excluded.last_processed
+            }
+        ))
+        await self.db.commit()
+
+    async def engagement_distribution(self, cutoff: datetime = None):
+        """Engagement counts per type since cutoff (or ever) from the rollups"""
+        counts = defaultdict(int)
+        engagement_type = func.coalesce(Engagement.engagement_type, "unknown")
+
+        last_id = (await self.db.execute(
+            select(RollupCheckpoint.last_engagement_id).where(
+                RollupCheckpoint.name == CHECKPOINT_NAME
+            )
+        )).scalar() or 0
+
+        query = select(
+            EngagementRollup.engagement_type,
+            func.sum(EngagementRollup.count)
+        )
+        if cutoff is None:
+            query = query.where(EngagementRollup.granularity == "day")
+        else:
+            # Whole hours of the first, partial day, then whole days
+            first_hour = self._bucket_start("hour", cutoff)
+            if first_hour < cutoff:
+                first_hour += timedelta(hours=1)
+            next_day = self._bucket_start("day", cutoff) + timedelta(days=1)
+            query = query.where(or_(
+                and_(
+                    EngagementRollup.granularity == "hour",
+                    EngagementRollup.bucket_start >= first_hour,
+                    EngagementRollup.bucket_start < next_day
+                ),
+                and_(
+                    EngagementRollup.granularity == "day",
+                    EngagementRollup.bucket_start >= next_day
+                )
+            ))
+
+            # Folded rows before the first whole hour come from the table
+            rows = (await self.db.execute(
+                select(engagement_type, func.count(Engagement.id)).where(
+                    Engagement.id <= last_id,
+                    Engagement.created_at >= cutoff,
+                    Engagement.created_at < first_hour
+                ).group_by(engagement_type)
+            )).all()
+            for row_type, count in rows:
+                counts[row_type] += count
+
+        rows = (await self.db.execute(
+            query.group_by(EngagementRollup.engagement_type)
+        )).all()
+        for row_type, count in rows:
+            counts[row_type] += int(count)
+
+        # Engagements stored since the last rollup run
+        tail = select(
+            engagement_type,
+            func.count(Engagement.id)
+        ).where(
+            Engagement.id > last_id,
+            Engagement.created_at.isnot(None)
+        )
+        if cutoff is not None:
+            tail = tail.where(Engagement.created_at >= cutoff)
+        rows = (await self.db.execute(
+            tail.group_by(engagement_type)
+        )).all()
+        for row_type, count in rows:
+            counts[row_type] += count
+
+        return dict(counts)
@@ -2,14 +2,30 @@ from fastapi import Request, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from models.user import User
+from core.cache.local import LocalCache
+from typing import NamedTuple
+import hashlib
 import jwt
+import time
 from datetime import datetime, timedelta
 import os
 
+class UserContext(NamedTuple):
+    """Verified identity of the caller"""
+    user_id: int
+    token_type: str
+    token: str
+
+    @property
+    def is_enterprise(self) -> bool:
+        return self.token_type == "enterprise"
+
 class AuthMiddleware(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super().__init__(auto_error=auto_error)
         self.secret_key = os.getenv("JWT_SECRET_KEY", "your-secret-key")
+        # Verified claims by token digest, each kept until its token expires
+        self.claims_cache = LocalCache(max_size=int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", 10000)))
 
     async def __call__(self, request: Request):
         credentials: HTTPAuthorizationCredentials = await super().__call__(request)
@@ -18,7 +34,7 @@ class AuthMiddleware(HTTPBearer):
             raise HTTPException(status_code=403, detail="Invalid authorization code.")
         
         try:
-            payload = jwt.decode(credentials.credentials, self.secret_key, algorithms=["HS256"])
+            payload = self.decode_claims(credentials.credentials)
             user_id: int = payload.get("user_id")
             token_type: str = payload.get("type", "user")
             
@@ -32,9 +48,44 @@ class AuthMiddleware(HTTPBearer):
             
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=403, detail="Token has expired")
-        except jwt.JWTError:
+        except jwt.PyJWTError:
             raise HTTPException(status_code=403, detail="Could not validate credentials")
 
+    async def context(self, request: Request) -> UserContext:
+        """Dependency yielding the verified caller, so handlers never decode tokens"""
+        token = await self(request)
+        return UserContext(request.state.user_id, request.state.token_type, token)
+
+    def decode_claims(self, token: str) -> dict:
+        """Verify a token once and reuse its claims until it expires"""
+        key = hashlib.sha256(token.encode()).hexdigest()
+        claims = self.claims_cache.get(key)
+        if claims is not None:
+            return claims
+
+        claims = jwt.decode(token, self.secret_key, algorithms=["HS256"])
+        ttl = claims["exp"] - time.time() if "exp" in claims else 300
+        if ttl > 0:
+            self.claims_cache.set(key, claims, ttl)
+        return claims
+
+    def verify_token(self, token: str):
+        """Claims of a valid token, or None"""
+        try:
+            return self.decode_claims(token)
+        except jwt.PyJWTError:
+            return None
+
+    def get_user_id(self, token: str):
+        """User id of a valid token, or None"""
+        claims = self.verify_token(token)
+        return claims.get("user_id") if claims else None
+
+    def token_tier(self, token: str):
+        """Tier of a valid token ("user" or "enterprise"), or None"""
+        claims = self.verify_token(token)
+        return claims.get("type", "user") if claims else None
+
     def create_token(self, user_id: int, is_enterprise: bool = False):
         """Create JWT token for user"""
         expires_delta = timedelta(days=30 if is_enterprise else 7)
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+import time
+
+class LocalCache:
+    """Bounded in-process LRU cache with a per-key expiry"""
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, key: str):
+        """Get value if present and not expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: any, ttl_seconds: float):
+        """Store value for ttl_seconds, evicting the least recently used key when full"""
+        self.entries[key] = (value, time.monotonic() + ttl_seconds)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: str):
+        """Drop key if present"""
+        self.entries.pop(key, None)
+
+    def clear(self):
+        """Drop every key"""
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
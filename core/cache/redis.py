@@ -1,32 +1,160 @@
-from redis import Redis
-import json
+from redis.asyncio import Redis, ConnectionPool
+from typing import Awaitable, Callable, Dict, List
+from core.cache.serializers import CacheSerializer
+from core.logger import log_error
+import asyncio
 from datetime import timedelta
+import uuid
 import os
 
+# Delete a lock only if we still hold it
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
 class RedisCache:
     def __init__(self):
-        self.redis = Redis(
+        self.pool = ConnectionPool(
             host=os.getenv("REDIS_HOST", "localhost"),
             port=int(os.getenv("REDIS_PORT", 6379)),
             db=0,
-            decode_responses=True
+            decode_responses=False,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0)),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0)),
+            health_check_interval=30
         )
-        
+        self.redis = Redis(connection_pool=self.pool)
+        self.serializer = CacheSerializer.from_env()
+
+        # In-flight cache fills in this process, by key
+        self.fills: Dict[str, asyncio.Future] = {}
+        self.lock_timeout = float(os.getenv("CACHE_LOCK_TIMEOUT", 30))
+        self.lock_poll_interval = float(os.getenv("CACHE_LOCK_POLL_INTERVAL", 0.05))
+
+    def _dumps(self, key: str, value: any) -> bytes:
+        """Serialize a value for storage"""
+        return self.serializer.dumps(key, value)
+
+    def _loads(self, raw: bytes):
+        """Deserialize a stored value"""
+        return self.serializer.loads(raw)
+
+    async def start(self):
+        """Start background work; a plain Redis cache has none"""
+
     async def get(self, key: str):
         """Get value from cache"""
-        value = self.redis.get(key)
+        value = await self.redis.get(key)
         if value:
-            return json.loads(value)
+            return self._loads(value)
         return None
-        
-    async def set(self, key: str, value: any, expire_minutes: int = 30):
-        """Set value in cache"""
-        self.redis.setex(
+
+    async def set(self, key: str, value: any, expire_minutes: int = 30, invalidate: bool = True):
+        """Set value in cache; invalidate only matters with a local tier"""
+        await self.redis.setex(
             key,
             timedelta(minutes=expire_minutes),
-            json.dumps(value)
+            self._dumps(key, value)
         )
-        
+
     async def delete(self, key: str):
         """Delete value from cache"""
-        self.redis.delete(key) 
\ No newline at end of file
+        await self.redis.delete(key)
+
+    async def mget(self, keys: List[str]) -> Dict[str, any]:
+        """Get several values in one round trip, skipping missing keys"""
+        if not keys:
+            return {}
+        values = await self.redis.mget(keys)
+        return {
+            key: self._loads(value)
+            for key, value in zip(keys, values)
+            if value
+        }
+
+    async def mset(self, values: Dict[str, any], expire_minutes: int = 30):
+        """Set several values with the same expiry in one pipelined round trip"""
+        if not values:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.setex(
+                    key,
+                    timedelta(minutes=expire_minutes),
+                    self._dumps(key, value)
+                )
+            await pipe.execute()
+
+    async def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[any]],
+        expire_minutes: int = 30,
+        stale_minutes: int = 0
+    ):
+        """Get value, filling a miss with loader at most once across all workers.
+
+        With stale_minutes, a copy outlives the value by that long and is
+        served while a single background fill refreshes it.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        if stale_minutes:
+            stale = await self.get(f"stale:{key}")
+            if stale is not None:
+                self._fill(key, loader, expire_minutes, stale_minutes)
+                return stale
+
+        # Shield the shared fill from callers that go away
+        return await asyncio.shield(self._fill(key, loader, expire_minutes, stale_minutes))
+
+    def _fill(self, key: str, loader, expire_minutes: int, stale_minutes: int) -> asyncio.Future:
+        """Join the in-flight fill for key or start one"""
+        fill = self.fills.get(key)
+        if fill is None:
+            fill = asyncio.ensure_future(
+                self._locked_fill(key, loader, expire_minutes, stale_minutes)
+            )
+            self.fills[key] = fill
+            fill.add_done_callback(lambda done: self._fill_done(key, done))
+        return fill
+
+    def _fill_done(self, key: str, fill: asyncio.Future):
+        self.fills.pop(key, None)
+        if not fill.cancelled() and fill.exception():
+            log_error(fill.exception(), f"Cache fill failed for {key}")
+
+    async def _locked_fill(self, key: str, loader, expire_minutes: int, stale_minutes: int):
+        """Run loader under a Redis lock, or wait for the worker holding it"""
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+
+        while True:
+            acquired = await self.redis.set(
+                lock_key, token, nx=True, px=int(self.lock_timeout * 1000)
+            )
+            if acquired:
+                try:
+                    value = await loader()
+                    await self.set(key, value, expire_minutes)
+                    if stale_minutes:
+                        await self.set(f"stale:{key}", value, expire_minutes + stale_minutes)
+                    return value
+                finally:
+                    await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+            # Another worker is filling; the lock expires if it dies
+            await asyncio.sleep(self.lock_poll_interval)
+            value = await self.get(key)
+            if value is not None:
+                return value
+
+    async def close(self):
+        """Release pooled connections"""
+        await self.pool.disconnect()
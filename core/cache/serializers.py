@@ -0,0 +1,122 @@
+from typing import Dict
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Encoded values start with MAGIC, a codec id and a flags byte. Values
+# written before codecs existed are plain JSON text, which never starts
+# with a NUL byte.
+MAGIC = b"\x00"
+FLAG_ZSTD = 1
+
+CODEC_IDS = {
+    "json": 1,
+    "orjson": 2,
+    "msgpack": 3
+}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+
+def _encode(codec: str, value: any) -> bytes:
+    if codec == "orjson":
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    if codec == "msgpack":
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value).encode()
+
+def _decode(codec: str, payload: bytes):
+    if codec == "orjson":
+        return orjson.loads(payload)
+    if codec == "msgpack":
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    return json.loads(payload)
+
+def _check_available(codec: str):
+    if codec not in CODEC_IDS:
+        raise ValueError(f"Unknown cache codec: {codec}")
+    if codec == "orjson" and orjson is None:
+        raise ValueError("Cache codec orjson requires the orjson package")
+    if codec == "msgpack" and msgpack is None:
+        raise ValueError("Cache codec msgpack requires the msgpack package")
+
+class CacheSerializer:
+    """Encode cached values with a codec chosen by key prefix"""
+    def __init__(
+        self,
+        default_codec: str = "json",
+        prefix_codecs: Dict[str, str] = None,
+        compress_threshold: int = 0
+    ):
+        self.default_codec = default_codec
+        self.prefix_codecs = prefix_codecs or {}
+        self.compress_threshold = compress_threshold
+
+        for codec in [default_codec, *self.prefix_codecs.values()]:
+            _check_available(codec)
+        if compress_threshold and zstandard is None:
+            raise ValueError("Cache compression requires the zstandard package")
+
+    @classmethod
+    def from_env(cls):
+        """Build from CACHE_DEFAULT_CODEC, CACHE_CODECS and CACHE_COMPRESS_THRESHOLD"""
+        prefix_codecs = {}
+        for entry in os.getenv("CACHE_CODECS", "").split(","):
+            if entry.strip():
+                prefix, _, codec = entry.partition("=")
+                prefix_codecs[prefix.strip()] = codec.strip()
+
+        return cls(
+            default_codec=os.getenv("CACHE_DEFAULT_CODEC", "json"),
+            prefix_codecs=prefix_codecs,
+            compress_threshold=int(os.getenv("CACHE_COMPRESS_THRESHOLD", 0))
+        )
+
+    def codec_for(self, key: str) -> str:
+        """Codec for key, preferring the longest matching prefix"""
+        matches = [prefix for prefix in self.prefix_codecs if key.startswith(prefix)]
+        if matches:
+            return self.prefix_codecs[max(matches, key=len)]
+        return self.default_codec
+
+    def dumps(self, key: str, value: any) -> bytes:
+        """Serialize value, compressing it when above the threshold"""
+        codec = self.codec_for(key)
+        payload = _encode(codec, value)
+
+        flags = 0
+        if self.compress_threshold and len(payload) > self.compress_threshold:
+            payload = zstandard.ZstdCompressor().compress(payload)
+            flags |= FLAG_ZSTD
+
+        return MAGIC + bytes([CODEC_IDS[codec], flags]) + payload
+
+    def loads(self, raw: bytes):
+        """Deserialize a value written by any codec, or legacy JSON"""
+        if not raw.startswith(MAGIC):
+            return json.loads(raw)
+
+        codec = CODEC_NAMES.get(raw[1])
+        if codec is None:
+            raise ValueError(f"Unknown cache codec id: {raw[1]}")
+        _check_available(codec)
+
+        payload = raw[3:]
+        if raw[2] & FLAG_ZSTD:
+            if zstandard is None:
+                raise ValueError("Cached value is zstd compressed but zstandard is not installed")
+            payload = zstandard.ZstdDecompressor().decompress(payload)
+
+        return _decode(codec, payload)
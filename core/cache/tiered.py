@@ -0,0 +1,140 @@
+from core.cache.redis import RedisCache
+from core.cache.local import LocalCache
+from core.logger import log_error
+from core.monitoring.metrics import CACHE_REQUESTS
+from typing import Dict, List
+import asyncio
+import uuid
+
+INVALIDATION_CHANNEL = "pult:cache:invalidate"
+
+class TieredCache(RedisCache):
+    """Redis cache with an in-process LRU in front of it.
+
+    Local entries expire together with their Redis key. Writes, unless they
+    opt out, and deletes are published on INVALIDATION_CHANNEL so other
+    workers drop their local copy. Cached values are shared between callers
+    and must not be mutated.
+    """
+    def __init__(self, max_size: int = 1024):
+        super().__init__()
+        self.local = LocalCache(max_size)
+        self.instance_id = uuid.uuid4().hex
+        self.pubsub = None
+        self.listener = None
+
+    async def start(self):
+        """Subscribe to invalidations from other workers"""
+        self.pubsub = self.redis.pubsub()
+        await self.pubsub.subscribe(INVALIDATION_CHANNEL)
+        self.listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    origin, _, key = message["data"].decode().partition(":")
+                    if origin != self.instance_id:
+                        self.local.delete(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Invalidations may have been missed while disconnected
+                log_error(e, "Cache invalidation listener failed")
+                self.local.clear()
+                await asyncio.sleep(1)
+
+    async def _invalidate(self, keys: List[str]):
+        """Tell other workers to drop their local copies"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.publish(INVALIDATION_CHANNEL, f"{self.instance_id}:{key}")
+            await pipe.execute()
+
+    async def get(self, key: str):
+        """Get value from the local cache, falling back to Redis"""
+        value = self.local.get(key)
+        if value is not None:
+            CACHE_REQUESTS.labels(tier="local", result="hit").inc()
+            return value
+        CACHE_REQUESTS.labels(tier="local", result="miss").inc()
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            raw, ttl_ms = await pipe.execute()
+
+        if not raw:
+            CACHE_REQUESTS.labels(tier="redis", result="miss").inc()
+            return None
+        CACHE_REQUESTS.labels(tier="redis", result="hit").inc()
+
+        value = self._loads(raw)
+        if ttl_ms > 0:
+            self.local.set(key, value, ttl_ms / 1000)
+        return value
+
+    async def set(self, key: str, value: any, expire_minutes: int = 30, invalidate: bool = True):
+        """Set value in both tiers.
+
+        Pass invalidate=False for values read through from the source of
+        truth, which other workers' copies cannot contradict.
+        """
+        await super().set(key, value, expire_minutes)
+        self.local.set(key, value, expire_minutes * 60)
+        if invalidate:
+            await self._invalidate([key])
+
+    async def delete(self, key: str):
+        """Delete value from both tiers"""
+        self.local.delete(key)
+        await super().delete(key)
+        await self._invalidate([key])
+
+    async def mget(self, keys: List[str]) -> Dict[str, any]:
+        """Get several values, only asking Redis for local misses"""
+        values = {}
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                values[key] = value
+        CACHE_REQUESTS.labels(tier="local", result="hit").inc(len(values))
+
+        missing = [key for key in keys if key not in values]
+        if missing:
+            CACHE_REQUESTS.labels(tier="local", result="miss").inc(len(missing))
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in missing:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                results = await pipe.execute()
+
+            for key, raw, ttl_ms in zip(missing, results[::2], results[1::2]):
+                if not raw:
+                    CACHE_REQUESTS.labels(tier="redis", result="miss").inc()
+                    continue
+                CACHE_REQUESTS.labels(tier="redis", result="hit").inc()
+                values[key] = self._loads(raw)
+                if ttl_ms > 0:
+                    self.local.set(key, values[key], ttl_ms / 1000)
+
+        return values
+
+    async def mset(self, values: Dict[str, any], expire_minutes: int = 30):
+        """Set several values in both tiers"""
+        await super().mset(values, expire_minutes)
+        for key, value in values.items():
+            self.local.set(key, value, expire_minutes * 60)
+        if values:
+            await self._invalidate(list(values))
+
+    async def close(self):
+        """Stop listening for invalidations and release connections"""
+        if self.listener:
+            self.listener.cancel()
+        if self.pubsub:
+            await self.pubsub.unsubscribe(INVALIDATION_CHANNEL)
+            await self.pubsub.close()
+        await super().close()
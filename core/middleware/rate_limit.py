@@ -1,47 +1,166 @@
 from fastapi import HTTPException
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from core.logger import log_error
+import hashlib
+import math
 import time
-from collections import defaultdict
-import threading
+import os
+
+# GCRA: the stored value is the theoretical arrival time (TAT) of the next
+# request in milliseconds. A request is allowed while it would not push
+# the TAT more than one period past now, which permits bursts of `limit`.
+GCRA_SCRIPT = """
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+
+local tat = tonumber(redis.call("GET", KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+
+local new_tat = tat + interval
+if new_tat - now > period then
+    return {0, math.ceil(new_tat - now - period)}
+end
+
+redis.call("SET", KEYS[1], new_tat, "PX", math.ceil(new_tat - now))
+return {1, 0}
+"""
+
+def _parse_limits(value: str) -> Dict[str, int]:
+    """Parse "name=limit,name=limit" settings"""
+    limits = {}
+    for entry in value.split(","):
+        if entry.strip():
+            name, _, limit = entry.partition("=")
+            limits[name.strip()] = int(limit)
+    return limits
+
+class LocalRateLimitBackend:
+    """Per-process GCRA state, evicting the least recently seen clients"""
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.tats: "OrderedDict[str, float]" = OrderedDict()
+
+    async def allow(self, key: str, limit: int, period_ms: int) -> Tuple[bool, int]:
+        """Record a request; returns whether it is allowed and ms until it would be"""
+        now = time.monotonic() * 1000
+        interval = period_ms / limit
+        tat = max(self.tats.get(key, now), now)
+
+        new_tat = tat + interval
+        if new_tat - now > period_ms:
+            return False, math.ceil(new_tat - now - period_ms)
+
+        self.tats[key] = new_tat
+        self.tats.move_to_end(key)
+        if len(self.tats) > self.max_keys:
+            self.tats.popitem(last=False)
+        return True, 0
+
+class RedisRateLimitBackend:
+    """GCRA state in Redis so every worker shares one limit per client.
+
+    Falls back to per-process limits while Redis is unreachable rather
+    than rejecting or waving through all traffic.
+    """
+    def __init__(self, redis: Redis = None, fallback: LocalRateLimitBackend = None):
+        self.redis = redis or Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=0,
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0)),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0))
+        )
+        self.script = self.redis.register_script(GCRA_SCRIPT)
+        self.fallback = fallback or LocalRateLimitBackend()
+
+    async def allow(self, key: str, limit: int, period_ms: int) -> Tuple[bool, int]:
+        """Record a request; returns whether it is allowed and ms until it would be"""
+        try:
+            allowed, retry_after = await self.script(
+                keys=[f"ratelimit:{key}"], args=[period_ms / limit, period_ms]
+            )
+        except RedisError as e:
+            log_error(e, "Rate limit backend unavailable, limiting per process")
+            return await self.fallback.allow(key, limit, period_ms)
+        return bool(allowed), int(retry_after)
 
 class RateLimiter:
-    def __init__(self, requests_per_minute=60):
+    """Requests per minute by client, with limits per tier and per route.
+
+    Tiers come from the client's token ("user", "enterprise") or are
+    "anonymous". A route limit, matched by longest path prefix, replaces
+    the tier limit on that route and is counted separately.
+    """
+    def __init__(
+        self,
+        requests_per_minute: int = 60,
+        backend: RedisRateLimitBackend = None,
+        tier_limits: Dict[str, int] = None,
+        route_limits: Dict[str, int] = None
+    ):
         self.requests_per_minute = requests_per_minute
-        self.requests = defaultdict(list)
-        self.lock = threading.Lock()
-        
-    def check_rate_limit(self, client_id: str):
+        self.backend = backend or LocalRateLimitBackend(
+            int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))
+        )
+        self.tier_limits = tier_limits if tier_limits is not None else _parse_limits(
+            os.getenv("RATE_LIMIT_TIERS", "enterprise=600")
+        )
+        self.route_limits = route_limits if route_limits is not None else _parse_limits(
+            os.getenv("RATE_LIMIT_ROUTES", "")
+        )
+
+    def limit_for(self, tier: str, path: str) -> Tuple[int, str]:
+        """Requests per minute and bucket name for a tier on a path"""
+        matches = [prefix for prefix in self.route_limits if path.startswith(prefix)]
+        if matches:
+            prefix = max(matches, key=len)
+            return self.route_limits[prefix], prefix
+        return self.tier_limits.get(tier, self.requests_per_minute), "*"
+
+    async def check_rate_limit(self, client_id: str, tier: str = "anonymous", path: str = ""):
         """Check if client has exceeded rate limit"""
-        now = time.time()
-        minute_ago = now - 60
-        
-        with self.lock:
-            # Clean old requests
-            self.requests[client_id] = [
-                req_time for req_time in self.requests[client_id]
-                if req_time > minute_ago
-            ]
-            
-            # Check limit
-            if len(self.requests[client_id]) >= self.requests_per_minute:
-                raise HTTPException(
-                    status_code=429,
-                    detail="Rate limit exceeded. Please try again in a minute."
-                )
-            
-            # Add new request
-            self.requests[client_id].append(now)
+        limit, bucket = self.limit_for(tier, path)
+        allowed, retry_after_ms = await self.backend.allow(
+            f"{tier}:{bucket}:{client_id}", limit, 60000
+        )
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded. Please try again later.",
+                headers={"Retry-After": str(math.ceil(retry_after_ms / 1000))}
+            )
 
 class RateLimitMiddleware:
-    def __init__(self, rate_limiter: RateLimiter):
+    def __init__(self, rate_limiter: RateLimiter, tier_resolver: Callable[[str], Optional[str]] = None):
         self.rate_limiter = rate_limiter
-        
+        # Maps a bearer token to its tier, or None if it does not verify
+        self.tier_resolver = tier_resolver
+
     async def __call__(self, request, call_next):
         # Get client IP or token as identifier
-        client_id = request.headers.get('authorization', request.client.host)
-        
+        authorization = request.headers.get('authorization')
+        tier = None
+        if authorization and self.tier_resolver:
+            tier = self.tier_resolver(authorization.split(" ", 1)[-1])
+
+        if tier:
+            # Key on a digest so raw tokens are not stored
+            client_id = hashlib.sha256(authorization.encode()).hexdigest()[:32]
+        else:
+            # Invalid tokens share their IP's limit so rotating them does not help
+            client_id = request.client.host
+            tier = "anonymous"
+
         # Check rate limit
-        self.rate_limiter.check_rate_limit(client_id)
-        
+        await self.rate_limiter.check_rate_limit(client_id, tier, request.url.path)
+
         # Process request
         response = await call_next(request)
-        return response 
\ No newline at end of file
+        return response
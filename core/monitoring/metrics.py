@@ -31,8 +31,13 @@ SYSTEM_INFO = Info('pult_system', 'System information')
 # WebSocket metrics
 WEBSOCKET_CONNECTIONS = Gauge(
     'pult_websocket_connections',
-    'Number of active WebSocket connections',
-    ['user_id']
+    'Number of active WebSocket connections'
+)
+
+WEBSOCKET_SEND_QUEUE_DEPTH = Histogram(
+    'pult_websocket_send_queue_depth',
+    'Messages waiting in a WebSocket send queue, sampled at each ping',
+    buckets=[0, 1, 5, 10, 25, 50, 100]
 )
 
 WEBSOCKET_MESSAGES = Counter(
@@ -41,6 +46,58 @@ WEBSOCKET_MESSAGES = Counter(
     ['direction', 'type']
 )
 
+WEBSOCKET_DROPPED = Counter(
+    'pult_websocket_dropped_total',
+    'Number of outbound WebSocket messages not sent',
+    ['reason']
+)
+
+# Twitter API metrics
+TWITTER_API_CALLS = Counter(
+    'pult_twitter_api_calls_total',
+    'Number of Twitter API calls made',
+    ['endpoint', 'status']
+)
+
+# Cache metrics
+CACHE_REQUESTS = Counter(
+    'pult_cache_requests_total',
+    'Number of cache lookups',
+    ['tier', 'result']
+)
+
+# Retention metrics
+RETENTION_ROWS_REMOVED = Counter(
+    'pult_retention_rows_removed_total',
+    'Number of engagement rows removed by retention',
+    ['engagement_type', 'method']
+)
+
+# Work queue metrics
+QUEUE_MESSAGES = Counter(
+    'pult_queue_messages_total',
+    'Number of work queue messages by outcome',
+    ['stream', 'status']
+)
+
+QUEUE_DEPTH = Gauge(
+    'pult_queue_depth',
+    'Number of queued messages not yet acked',
+    ['stream']
+)
+
+QUEUE_PENDING = Gauge(
+    'pult_queue_pending',
+    'Number of messages read by a consumer but not yet acked',
+    ['stream']
+)
+
+QUEUE_LAG = Gauge(
+    'pult_queue_lag_seconds',
+    'Age of the oldest message not yet acked',
+    ['stream']
+)
+
 # Background task metrics
 BACKGROUND_TASKS = Counter(
     'pult_background_tasks_total',
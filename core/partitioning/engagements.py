@@ -0,0 +1,60 @@
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+PARENT_TABLE = "engagements"
+
+def month_start(timestamp: datetime) -> datetime:
+    return datetime(timestamp.year, timestamp.month, 1)
+
+def add_months(month: datetime, months: int) -> datetime:
+    years, month_idx = divmod(month.month - 1 + months, 12)
+    return datetime(month.year + years, month_idx + 1, 1)
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT_TABLE}_{month:%Y_%m}"
+
+def is_partitioned(conn: Connection) -> bool:
+    """Whether engagements is a range-partitioned table"""
+    return conn.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            WHERE c.relname = :table
+        )
+    """), {"table": PARENT_TABLE}).scalar()
+
+def list_partitions(conn: Connection):
+    """Monthly partitions of engagements as (name, month start), oldest first"""
+    names = conn.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+    """), {"table": PARENT_TABLE}).scalars().all()
+
+    partitions = []
+    for name in names:
+        try:
+            month = datetime.strptime(name[len(PARENT_TABLE) + 1:], "%Y_%m")
+        except ValueError:
+            continue  # default partition
+        partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def ensure_partitions(conn: Connection, start: datetime, months_ahead: int = 3):
+    """Create monthly partitions from start's month up to months_ahead from now"""
+    month = month_start(start)
+    last = add_months(month_start(datetime.utcnow()), months_ahead)
+    while month <= last:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(month)} "
+            f"PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+        ))
+        month = add_months(month, 1)
+
+def maintain_partitions(conn: Connection, months_ahead: int = 3):
+    """Keep future partitions ready when engagements is partitioned"""
+    if is_partitioned(conn):
+        ensure_partitions(conn, datetime.utcnow(), months_ahead)
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from redis.asyncio import Redis
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.engagement import Engagement
+from core.pult.processor import TIME_PERIODS, PERIOD_SECONDS
+from core.cache.redis import RELEASE_LOCK_SCRIPT
+import uuid
+import os
+
+DIRTY_KEY = "pult:dirty_users"
+CLAIMED_KEY = "pult:dirty_users:claimed"
+LEASE_KEY = "pult:dirty_users:lease"
+LAST_RUN_KEY = "pult:dirty_users:last_run"
+
+# Take the lease, then move newly dirty users into the claimed set. Users a
+# failed run left in the claimed set are handed out again.
+CLAIM_SCRIPT = """
+if not redis.call("set", KEYS[3], ARGV[1], "NX", "PX", ARGV[2]) then
+    return false
+end
+if redis.call("exists", KEYS[1]) == 1 then
+    redis.call("sunionstore", KEYS[2], KEYS[1], KEYS[2])
+    redis.call("del", KEYS[1])
+end
+return redis.call("smembers", KEYS[2])
+"""
+
+class DirtyUserSet:
+    """Redis set of users whose engagements changed since they were last scored.
+
+    One scoring run at a time claims the set under a lease; users are only
+    removed once their new scores are written, so a failed run leaves them
+    for the next one.
+    """
+    def __init__(self, redis: Redis = None):
+        self.redis = redis or Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=0,
+            decode_responses=True,
+            socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0)),
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0))
+        )
+        self.lease_ms = int(os.getenv("PULT_SCORING_LEASE_SECONDS", 3600)) * 1000
+
+    async def mark(self, user_ids: Iterable[int]):
+        """Flag users for rescoring"""
+        user_ids = list(user_ids)
+        if user_ids:
+            await self.redis.sadd(DIRTY_KEY, *user_ids)
+
+    async def claim(self) -> Optional[Tuple[str, List[int], Optional[datetime]]]:
+        """Claim dirty users for a scoring run.
+
+        Returns the lease token, the claimed user ids and when the last run
+        completed, or None while another run holds the lease.
+        """
+        token = uuid.uuid4().hex
+        members = await self.redis.eval(
+            CLAIM_SCRIPT, 3, DIRTY_KEY, CLAIMED_KEY, LEASE_KEY, token, self.lease_ms
+        )
+        if members is None:
+            return None
+
+        last_run = await self.redis.get(LAST_RUN_KEY)
+        return (
+            token,
+            sorted(int(user_id) for user_id in members),
+            datetime.fromisoformat(last_run) if last_run else None
+        )
+
+    async def complete(self, token: str, scored_user_ids: Iterable[int], run_at: datetime):
+        """Drop scored users from the claim and release the lease"""
+        scored_user_ids = list(scored_user_ids)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if scored_user_ids:
+                pipe.srem(CLAIMED_KEY, *scored_user_ids)
+            pipe.set(LAST_RUN_KEY, run_at.isoformat())
+            await pipe.execute()
+        await self.release(token)
+
+    async def release(self, token: str):
+        """Give up the lease without touching the claimed users"""
+        await self.redis.eval(RELEASE_LOCK_SCRIPT, 1, LEASE_KEY, token)
+
+    async def close(self):
+        """Close the Redis connection"""
+        await self.redis.aclose()
+
+async def rolled_over_user_ids(db: AsyncSession, since: datetime, now: datetime) -> List[int]:
+    """Users with an engagement that moved into an older time period in (since, now].
+
+    Periods are whole PERIOD_SECONDS of age, so an engagement changes period
+    when its age crosses a multiple of that. Engagements in the last period
+    never move again.
+    """
+    windows = [
+        and_(
+            Engagement.created_at > since - timedelta(seconds=k * PERIOD_SECONDS),
+            Engagement.created_at <= now - timedelta(seconds=k * PERIOD_SECONDS)
+        )
+        for k in range(1, TIME_PERIODS)
+    ]
+    result = await db.execute(
+        select(Engagement.user_id).where(or_(*windows)).distinct()
+    )
+    return [row[0] for row in result.all()]
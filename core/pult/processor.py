@@ -1,36 +1,125 @@
 import numpy as np
 from datetime import datetime
+from sqlalchemy import DateTime, func, literal
 from sqlalchemy.orm import Session
 from models.user import User
 from models.engagement import Engagement
 
+# Engagement type -> tensor row
+ENGAGEMENT_TYPES = {
+    'like': 0,
+    'retweet': 1,
+    'reply': 2
+}
+
+# Number of time periods and their width in days
+TIME_PERIODS = 10
+PERIOD_DAYS = 3
+PERIOD_SECONDS = PERIOD_DAYS * 24 * 60 * 60
+
+# Weights for different engagement types
+TYPE_WEIGHTS = np.array([0.5, 0.8, 1.0])
+
+# Closed-form stand-in for the time periods: an engagement aged `a` periods
+# weighs DECAY_FLOOR + DECAY_SCALE * exp(-0.3 * a). Fitted to the bucketed
+# weights exp(-0.2 * min(floor(a), 9)) so that engagements spread evenly over
+# any window of a period or more sum to within 3% of the bucketed weights.
+# A single engagement weighs 16% less to 41% more than its bucket (the worst
+# case is just past 27 days, where buckets reach their floor), and engagements
+# bunched at the same point of their periods sum to within 11%.
+DECAY_FLOOR = float(np.exp(-0.2 * (TIME_PERIODS - 1)))
+DECAY_SCALE = 0.99
+DECAY_RATE = 0.3 / PERIOD_SECONDS
+
 class PULTProcessor:
     def __init__(self, db: Session):
         self.db = db
         
-    def process_user_data(self, user_id: int):
+    def process_user_data(self, user_id: int, aggregate_in_db: bool = False):
         """Process user's engagement data using PULT algorithm"""
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user:
+        if not self.db.query(User.id).filter(User.id == user_id).first():
             raise ValueError("User not found")
-            
-        # Get user engagements
-        engagements = self.db.query(Engagement).filter(
-            Engagement.user_id == user_id
-        ).all()
         
-        # Create engagement tensor
-        engagement_tensor = self._create_engagement_tensor(engagements)
+        return self.process_users_batch([user_id], aggregate_in_db=aggregate_in_db)[user_id]
+    
+    def current_score(self, user: User, now: datetime = None) -> float:
+        """User's score as of now, decaying the sums kept by scoring and ingest"""
+        state = (user.engagement_data or {}).get("decay")
+        if not state:
+            return user.pult_score
         
-        # Calculate PULT score
-        pult_score = self._calculate_pult_score(engagement_tensor)
+        # Sums written before scoring kept them alongside pult_score
+        if user.last_processed and self._epoch_seconds(user.last_processed) > state["updated_at"]:
+            return user.pult_score
+        return self._decayed_score(state, now or datetime.utcnow())
+    
+    def fold_new_engagements(self, user_id: int, engagements):
+        """Add just-stored engagements to the user's decayed sums; the caller commits.
+        
+        Users not scored yet have no sums and get them from their first
+        scoring run, which also recounts anything folded in meanwhile.
+        """
+        if not engagements:
+            return
+        user = self.db.query(User).filter(User.id == user_id).with_for_update().first()
+        state = (user.engagement_data or {}).get("decay") if user else None
+        if not state:
+            return
+        
+        # Assign a new dict so the JSON column is flagged as modified
+        user.engagement_data = {
+            **user.engagement_data,
+            "decay": self._fold_decayed(state, engagements, datetime.utcnow())
+        }
+    
+    def process_users_batch(self, user_ids=None, batch_size: int = 1000, aggregate_in_db: bool = False):
+        """Score many users in one pass and write the scores back in bulk"""
+        if user_ids is None:
+            user_ids = [row[0] for row in self.db.query(User.id).all()]
+        
+        now = datetime.utcnow()
+        scores = {}
+        
+        for start in range(0, len(user_ids), batch_size):
+            chunk = np.unique(np.asarray(user_ids[start:start + batch_size], dtype=np.int64))
+            
+            if aggregate_in_db:
+                tensors, decayed = self._aggregate_engagement_tensors(chunk, now)
+            else:
+                # Fetch engagements for the whole chunk as columns
+                rows = self.db.query(
+                    Engagement.user_id,
+                    Engagement.engagement_type,
+                    Engagement.created_at,
+                    Engagement.sentiment_score
+                ).filter(
+                    Engagement.user_id.in_(chunk.tolist()),
+                    Engagement.created_at.isnot(None)
+                ).all()
+                
+                tensors = self._create_engagement_tensors(chunk, rows, now)
+                decayed = self._create_decayed_sums(chunk, rows, now)
+            chunk_scores = self._calculate_pult_scores(tensors)
+            
+            # Undecayed totals per type are the tensors summed over periods
+            totals = tensors.sum(axis=2)
+            now_seconds = self._epoch_seconds(now)
+            self.db.bulk_update_mappings(User, [
+                {
+                    "id": int(user_id),
+                    "pult_score": float(score),
+                    "last_processed": now,
+                    "engagement_data": {
+                        "decay": {"sums": sums.tolist(), "totals": user_totals.tolist(), "updated_at": now_seconds}
+                    }
+                }
+                for user_id, score, sums, user_totals in zip(chunk, chunk_scores, decayed, totals)
+            ])
+            scores.update(zip(chunk.tolist(), chunk_scores.tolist()))
         
-        # Update user's PULT score
-        user.pult_score = float(pult_score)
-        user.last_processed = datetime.utcnow()
         self.db.commit()
         
-        return pult_score
+        return scores
     
     def _create_engagement_tensor(self, engagements):
         """Convert engagements into a tensor representation"""
@@ -52,6 +141,147 @@ class PULTProcessor:
             
         return tensor
     
+    def _fold_decayed(self, state, engagements, now: datetime):
+        """Decay running sums to now and add engagements to them.
+        
+        Per type, `sums` holds sentiment weighted engagements decayed to
+        `updated_at` and `totals` the undecayed weights behind DECAY_FLOOR.
+        """
+        now_seconds = self._epoch_seconds(now)
+        if state:
+            sums = np.array(state["sums"]) * np.exp(-DECAY_RATE * max(now_seconds - state["updated_at"], 0))
+            totals = np.array(state["totals"])
+        else:
+            sums = np.zeros(len(ENGAGEMENT_TYPES))
+            totals = np.zeros(len(ENGAGEMENT_TYPES))
+        
+        for eng in engagements:
+            if eng.created_at is None:
+                continue
+            eng_type_idx = ENGAGEMENT_TYPES.get(eng.engagement_type, 0)
+            weight = 1 + (eng.sentiment_score or 0)
+            age = max(now_seconds - self._epoch_seconds(eng.created_at), 0)
+            
+            sums[eng_type_idx] += weight * np.exp(-DECAY_RATE * age)
+            totals[eng_type_idx] += weight
+        
+        return {"sums": sums.tolist(), "totals": totals.tolist(), "updated_at": now_seconds}
+    
+    def _decayed_weight(self, state, at: datetime) -> float:
+        """Type weighted engagement total from decayed sums at any later time"""
+        elapsed = max(self._epoch_seconds(at) - state["updated_at"], 0)
+        sums = np.array(state["sums"]) * np.exp(-DECAY_RATE * elapsed)
+        weighted = DECAY_FLOOR * np.array(state["totals"]) + DECAY_SCALE * sums
+        return float(np.dot(TYPE_WEIGHTS, weighted))
+    
+    def _decayed_score(self, state, at: datetime) -> float:
+        """Score from decayed sums at any later time, without touching engagements"""
+        # Same 0-100 normalization as the bucketed score
+        return float(min(100, max(0, self._decayed_weight(state, at) * 10)))
+    
+    def _epoch_seconds(self, timestamp: datetime) -> float:
+        return (timestamp - datetime(1970, 1, 1)).total_seconds()
+    
+    def _create_engagement_tensors(self, user_ids, rows, now: datetime):
+        """Scatter columnar engagement rows into a (users x 3 x 10) tensor"""
+        tensors = np.zeros((len(user_ids), len(ENGAGEMENT_TYPES), TIME_PERIODS))
+        if not rows:
+            return tensors
+        
+        row_users, row_types, row_times, row_sentiments = zip(*rows)
+        
+        # Calculate time period from whole days elapsed
+        created_at = np.asarray(row_times, dtype='datetime64[us]')
+        days = (np.datetime64(now, 'us') - created_at) // np.timedelta64(1, 'D')
+        time_idx = np.clip(days // PERIOD_DAYS, 0, TIME_PERIODS - 1)
+        
+        # Sentiment weighting, missing sentiment counts as neutral
+        weights = 1 + np.nan_to_num(np.asarray(row_sentiments, dtype=float))
+        
+        return self._scatter_engagements(tensors, user_ids, row_users, row_types, time_idx, weights)
+    
+    def _create_decayed_sums(self, user_ids, rows, now: datetime):
+        """Sum columnar engagement rows decayed to now into a (users x 3) array"""
+        sums = np.zeros((len(user_ids), len(ENGAGEMENT_TYPES), 1))
+        if not rows:
+            return sums[:, :, 0]
+        
+        row_users, row_types, row_times, row_sentiments = zip(*rows)
+        
+        created_at = np.asarray(row_times, dtype='datetime64[us]')
+        age = np.maximum((np.datetime64(now, 'us') - created_at) / np.timedelta64(1, 's'), 0)
+        weights = (1 + np.nan_to_num(np.asarray(row_sentiments, dtype=float))) * np.exp(-DECAY_RATE * age)
+        
+        return self._scatter_engagements(
+            sums, user_ids, row_users, row_types, np.zeros(len(rows), dtype=np.intp), weights
+        )[:, :, 0]
+    
+    def _aggregate_engagement_tensors(self, user_ids, now: datetime):
+        """Build a (users x 3 x 10) tensor and (users x 3) decayed sums in SQL"""
+        tensors = np.zeros((len(user_ids), len(ENGAGEMENT_TYPES), TIME_PERIODS))
+        decayed = np.zeros((len(user_ids), len(ENGAGEMENT_TYPES), 1))
+        
+        # Whole periods elapsed, clamped like the in-memory builder
+        age = func.extract('epoch', literal(now, DateTime) - Engagement.created_at)
+        period = func.least(
+            func.greatest(func.floor(age / PERIOD_SECONDS), 0),
+            TIME_PERIODS - 1
+        ).label('period')
+        
+        weight = 1 + func.coalesce(Engagement.sentiment_score, 0)
+        rows = self.db.query(
+            Engagement.user_id,
+            Engagement.engagement_type,
+            period,
+            func.sum(weight),
+            func.sum(weight * func.exp(-DECAY_RATE * func.greatest(age, 0)))
+        ).filter(
+            Engagement.user_id.in_(user_ids.tolist()),
+            Engagement.created_at.isnot(None)
+        ).group_by(
+            Engagement.user_id,
+            Engagement.engagement_type,
+            period
+        ).all()
+        
+        if not rows:
+            return tensors, decayed[:, :, 0]
+        
+        row_users, row_types, row_periods, row_weights, row_decayed = zip(*rows)
+        
+        self._scatter_engagements(
+            tensors,
+            user_ids,
+            row_users,
+            row_types,
+            np.asarray(row_periods, dtype=np.intp),
+            np.asarray(row_weights, dtype=float)
+        )
+        self._scatter_engagements(
+            decayed,
+            user_ids,
+            row_users,
+            row_types,
+            np.zeros(len(rows), dtype=np.intp),
+            np.asarray(row_decayed, dtype=float)
+        )
+        return tensors, decayed[:, :, 0]
+    
+    def _scatter_engagements(self, tensors, user_ids, row_users, row_types, time_idx, weights):
+        """Add weighted engagement rows into their user, type and period cells"""
+        # Map user ids onto tensor rows (user_ids must be sorted)
+        user_idx = np.searchsorted(user_ids, np.asarray(row_users, dtype=np.int64))
+        
+        # Unknown engagement types count as likes
+        types = np.asarray(row_types, dtype=object)
+        type_idx = np.zeros(len(types), dtype=np.intp)
+        for eng_type, idx in ENGAGEMENT_TYPES.items():
+            type_idx[types == eng_type] = idx
+        
+        np.add.at(tensors, (user_idx, type_idx, time_idx), weights)
+        
+        return tensors
+    
     def _calculate_pult_score(self, tensor):
         """Calculate PULT score from engagement tensor"""
         # Weights for different engagement types
@@ -68,4 +298,15 @@ class PULTProcessor:
         # Normalize to 0-100 range
         normalized_score = min(100, max(0, final_score * 10))
         
-        return normalized_score 
\ No newline at end of file
+        return normalized_score
+    
+    def _calculate_pult_scores(self, tensors):
+        """Calculate PULT scores for a stack of engagement tensors"""
+        type_weights = np.array([0.5, 0.8, 1.0])
+        time_weights = np.exp(-np.arange(TIME_PERIODS) * 0.2)
+        
+        # Weighted sum over types and time periods in one reduction
+        final_scores = np.einsum('utk,t,k->u', tensors, type_weights, time_weights)
+        
+        # Normalize to 0-100 range
+        return np.clip(final_scores * 10, 0, 100)
@@ -0,0 +1,36 @@
+from sqlalchemy import func
+from models.user import User
+from core.pult.processor import PULTProcessor
+import time
+
+# Score changes smaller than this are not worth broadcasting
+SCORE_CHANGE_TOLERANCE = 1e-6
+
+def score_shard(shard: int, shard_count: int, user_ids=None):
+    """Score the given users, or every user whose id falls into the shard.
+
+    Runs inside a spawned worker process, so importing database here gives
+    the worker its own engine and connection pool. Returns the ids scored
+    and the scores that changed.
+    """
+    from database import SessionLocal
+
+    start_time = time.time()
+    db = SessionLocal()
+    try:
+        query = db.query(User.id, User.pult_score)
+        if user_ids is None:
+            query = query.filter(func.mod(User.id, shard_count) == shard)
+        else:
+            query = query.filter(User.id.in_(user_ids))
+        previous = dict(query.all())
+
+        scores = PULTProcessor(db).process_users_batch(list(previous), aggregate_in_db=True)
+    finally:
+        db.close()
+
+    changed = {
+        user_id: score for user_id, score in scores.items()
+        if previous[user_id] is None or abs(score - previous[user_id]) > SCORE_CHANGE_TOLERANCE
+    }
+    return shard, list(scores), changed, time.time() - start_time
@@ -0,0 +1,111 @@
+from collections import OrderedDict, deque
+from typing import Dict, List, Tuple
+from core.queue.redis import QueueFull, message_age_seconds
+import asyncio
+import time
+
+class LocalStreamQueue:
+    """In-process stand-in for RedisStreamQueue with the same delivery rules.
+
+    Messages are redelivered after claim_idle_ms until acked and parked in
+    dead_letters after max_deliveries. Nothing survives a restart, so this
+    is for tests and single-process development only.
+    """
+    def __init__(
+        self,
+        max_length: int = 10000,
+        claim_idle_ms: int = 60000,
+        max_deliveries: int = 5,
+        publish_timeout: float = 30,
+        poll_interval: float = 0.01
+    ):
+        self.max_length = max_length
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.publish_timeout = publish_timeout
+        self.poll_interval = poll_interval
+
+        # Unacked messages by id, in publish order
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.undelivered = deque()
+        # Message id -> [consumer, delivered_at, times_delivered]
+        self.pending: Dict[str, list] = {}
+        self.dead_letters: List[Tuple[str, dict]] = []
+        self.last_ms = 0
+        self.sequence = 0
+
+    async def ensure_group(self):
+        """The local queue has a single implicit group"""
+
+    def _next_id(self) -> str:
+        now_ms = int(time.time() * 1000)
+        if now_ms > self.last_ms:
+            self.last_ms, self.sequence = now_ms, 0
+        else:
+            self.sequence += 1
+        return f"{self.last_ms}-{self.sequence}"
+
+    async def publish(self, payload: dict) -> str:
+        """Append a message, waiting while the backlog is at max_length"""
+        deadline = time.monotonic() + self.publish_timeout
+        while len(self.entries) >= self.max_length:
+            if time.monotonic() >= deadline:
+                raise QueueFull("Local queue is full")
+            await asyncio.sleep(self.poll_interval)
+
+        message_id = self._next_id()
+        self.entries[message_id] = payload
+        self.undelivered.append(message_id)
+        return message_id
+
+    async def read(self, consumer: str, count: int = 100, block_ms: int = 1000) -> List[Tuple[str, dict]]:
+        """Read messages for consumer, reclaiming stale ones before new ones"""
+        deadline = time.monotonic() + block_ms / 1000
+        while True:
+            message_ids = self._claim_stale(count) or [
+                self.undelivered.popleft()
+                for _ in range(min(count, len(self.undelivered)))
+            ]
+            if message_ids or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        now = time.monotonic()
+        for message_id in message_ids:
+            times_delivered = self.pending.get(message_id, [None, None, 0])[2]
+            self.pending[message_id] = [consumer, now, times_delivered + 1]
+        return [(message_id, self.entries[message_id]) for message_id in message_ids]
+
+    def _claim_stale(self, count: int) -> List[str]:
+        cutoff = time.monotonic() - self.claim_idle_ms / 1000
+        stale = [
+            message_id for message_id, (_, delivered_at, _) in self.pending.items()
+            if delivered_at <= cutoff
+        ][:count]
+
+        retry = []
+        for message_id in stale:
+            if self.pending[message_id][2] >= self.max_deliveries:
+                self.dead_letters.append((message_id, self.entries.pop(message_id)))
+                del self.pending[message_id]
+            else:
+                retry.append(message_id)
+        return retry
+
+    async def ack(self, message_ids: List[str]):
+        """Acknowledge handled messages and remove them"""
+        for message_id in message_ids:
+            self.pending.pop(message_id, None)
+            self.entries.pop(message_id, None)
+
+    async def stats(self) -> dict:
+        """Backlog length, messages read but not acked, and oldest message age"""
+        oldest = next(iter(self.entries), None)
+        return {
+            "depth": len(self.entries),
+            "pending": len(self.pending),
+            "lag_seconds": message_age_seconds(oldest) if oldest else 0.0
+        }
+
+    async def close(self):
+        """Nothing to release"""
@@ -0,0 +1,151 @@
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from typing import List, Tuple
+from core.monitoring.metrics import QUEUE_MESSAGES
+import asyncio
+import json
+import time
+import os
+
+class QueueFull(Exception):
+    """Raised when a publisher waited too long for the queue to drain"""
+
+def message_age_seconds(message_id: str) -> float:
+    """Age of a stream entry from the millisecond timestamp in its id"""
+    return max(0.0, time.time() - int(message_id.split("-")[0]) / 1000)
+
+class RedisStreamQueue:
+    """Durable work queue on a Redis stream read through a consumer group.
+
+    Entries stay in the stream until acked, so a consumer that dies after
+    reading leaves them pending and another consumer claims them once they
+    have been idle for claim_idle_ms. Acked entries are deleted, which keeps
+    the stream length equal to the backlog publishers are throttled on.
+    """
+    def __init__(
+        self,
+        stream: str,
+        group: str,
+        redis: Redis = None,
+        max_length: int = None,
+        claim_idle_ms: int = None,
+        max_deliveries: int = None
+    ):
+        self.stream = stream
+        self.group = group
+        self.dead_letter_stream = f"{stream}:dead"
+        # Blocking reads need a socket timeout longer than the block time
+        self.redis = redis or Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=0,
+            decode_responses=True,
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0)),
+            health_check_interval=30
+        )
+        self.max_length = max_length or int(os.getenv("QUEUE_MAX_LENGTH", 10000))
+        self.claim_idle_ms = claim_idle_ms or int(os.getenv("QUEUE_CLAIM_IDLE_MS", 60000))
+        self.max_deliveries = max_deliveries or int(os.getenv("QUEUE_MAX_DELIVERIES", 5))
+        self.publish_timeout = float(os.getenv("QUEUE_PUBLISH_TIMEOUT", 30))
+        self.poll_interval = float(os.getenv("QUEUE_POLL_INTERVAL", 0.1))
+
+    async def ensure_group(self):
+        """Create the stream and consumer group if they do not exist"""
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def publish(self, payload: dict) -> str:
+        """Append a message, waiting while the backlog is at max_length"""
+        deadline = time.monotonic() + self.publish_timeout
+        while await self.redis.xlen(self.stream) >= self.max_length:
+            if time.monotonic() >= deadline:
+                QUEUE_MESSAGES.labels(stream=self.stream, status="rejected").inc()
+                raise QueueFull(f"Queue {self.stream} is full")
+            await asyncio.sleep(self.poll_interval)
+
+        message_id = await self.redis.xadd(self.stream, {"data": json.dumps(payload)})
+        QUEUE_MESSAGES.labels(stream=self.stream, status="published").inc()
+        return message_id
+
+    async def read(self, consumer: str, count: int = 100, block_ms: int = 1000) -> List[Tuple[str, dict]]:
+        """Read messages for consumer, reclaiming stale ones before new ones"""
+        messages = await self._claim_stale(consumer, count)
+        if messages:
+            return messages
+
+        response = await self.redis.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count, block=block_ms
+        )
+        for _, entries in response or []:
+            messages.extend(
+                (message_id, json.loads(fields["data"]))
+                for message_id, fields in entries
+            )
+        return messages
+
+    async def _claim_stale(self, consumer: str, count: int) -> List[Tuple[str, dict]]:
+        """Take over messages another consumer read but never acked"""
+        stale = await self.redis.xpending_range(
+            self.stream, self.group, min="-", max="+", count=count,
+            idle=self.claim_idle_ms
+        )
+        if not stale:
+            return []
+
+        # Messages that keep failing are parked instead of retried forever
+        dead = [entry["message_id"] for entry in stale if entry["times_delivered"] >= self.max_deliveries]
+        retry = [entry["message_id"] for entry in stale if entry["times_delivered"] < self.max_deliveries]
+        if dead:
+            await self._dead_letter(dead)
+        if not retry:
+            return []
+
+        claimed = await self.redis.xclaim(
+            self.stream, self.group, consumer, self.claim_idle_ms, retry
+        )
+        QUEUE_MESSAGES.labels(stream=self.stream, status="claimed").inc(len(claimed))
+        return [
+            (message_id, json.loads(fields["data"]))
+            for message_id, fields in claimed
+            if fields
+        ]
+
+    async def _dead_letter(self, message_ids: List[str]):
+        """Copy messages to the dead letter stream and drop them from the queue"""
+        for message_id in message_ids:
+            entries = await self.redis.xrange(self.stream, message_id, message_id)
+            for _, fields in entries:
+                await self.redis.xadd(
+                    self.dead_letter_stream,
+                    {"message_id": message_id, "data": fields["data"]}
+                )
+        await self.ack(message_ids)
+        QUEUE_MESSAGES.labels(stream=self.stream, status="dead_lettered").inc(len(message_ids))
+
+    async def ack(self, message_ids: List[str]):
+        """Acknowledge handled messages and remove them from the stream"""
+        if not message_ids:
+            return
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, *message_ids)
+            pipe.xdel(self.stream, *message_ids)
+            await pipe.execute()
+        QUEUE_MESSAGES.labels(stream=self.stream, status="acked").inc(len(message_ids))
+
+    async def stats(self) -> dict:
+        """Backlog length, messages read but not acked, and oldest message age"""
+        depth = await self.redis.xlen(self.stream)
+        pending = await self.redis.xpending(self.stream, self.group)
+        oldest = await self.redis.xrange(self.stream, count=1)
+        return {
+            "depth": depth,
+            "pending": pending["pending"],
+            "lag_seconds": message_age_seconds(oldest[0][0]) if oldest else 0.0
+        }
+
+    async def close(self):
+        """Close the Redis connection"""
+        await self.redis.aclose()
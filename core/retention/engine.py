@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from sqlalchemy import delete, or_, select, text
+from sqlalchemy.exc import DBAPIError
+from models.engagement import Engagement
+from database import AsyncSessionLocal, async_engine
+from core.partitioning.engagements import PARENT_TABLE, add_months, is_partitioned, list_partitions
+from core.monitoring.metrics import PROCESSING_TIME, RETENTION_ROWS_REMOVED
+from core.pult.dirty import DirtyUserSet
+from core.logger import log_error, log_info
+import asyncio
+import time
+import os
+
+# Distinct users of a partition by skip scan: one probe of the
+# (user_id, created_at) index per user instead of reading every row
+PARTITION_USERS = """
+WITH RECURSIVE users AS (
+    (SELECT user_id FROM {name} WHERE user_id IS NOT NULL ORDER BY user_id LIMIT 1)
+    UNION ALL
+    SELECT (SELECT user_id FROM {name} WHERE user_id > users.user_id ORDER BY user_id LIMIT 1)
+    FROM users WHERE users.user_id IS NOT NULL
+)
+SELECT user_id FROM users WHERE user_id IS NOT NULL
+"""
+
+class RetentionEngine:
+    """Removes engagements older than their type's retention period.
+
+    Whole monthly partitions are dropped once every type has expired them;
+    remaining rows are deleted in small batches with a pause in between so
+    the job never holds long locks or writes a burst of WAL. Users who lose
+    engagements are marked dirty so their scores are recomputed.
+    """
+    def __init__(self, dirty_users: DirtyUserSet = None):
+        self.dirty_users = dirty_users or DirtyUserSet()
+        self.default_days = int(os.getenv("RETENTION_DAYS", 90))
+        self.days_by_type = {}
+        for entry in os.getenv("RETENTION_DAYS_BY_TYPE", "").split(","):
+            if entry.strip():
+                engagement_type, _, days = entry.partition("=")
+                self.days_by_type[engagement_type.strip()] = int(days)
+        self.batch_size = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+        self.batch_pause = float(os.getenv("RETENTION_BATCH_PAUSE", 0.1))
+        self.detach_lock_timeout = int(os.getenv("RETENTION_DETACH_LOCK_TIMEOUT", 5))
+
+    async def run(self):
+        """Apply every retention policy, returning the number of rows removed"""
+        start_time = time.time()
+        now = datetime.utcnow()
+
+        # Partitions are only dropped when no type keeps their rows
+        longest_days = max([self.default_days, *self.days_by_type.values()])
+        removed = await self._drop_expired_partitions(now - timedelta(days=longest_days))
+
+        for engagement_type, days in self.days_by_type.items():
+            removed += await self._delete_in_batches(
+                Engagement.engagement_type == engagement_type,
+                now - timedelta(days=days),
+                engagement_type
+            )
+        removed += await self._delete_in_batches(
+            or_(
+                Engagement.engagement_type.notin_(list(self.days_by_type)),
+                Engagement.engagement_type.is_(None)
+            ),
+            now - timedelta(days=self.default_days),
+            "default"
+        )
+
+        PROCESSING_TIME.labels(task_type="retention").observe(time.time() - start_time)
+        log_info(f"Retention removed {removed} engagements in {time.time() - start_time:.1f}s")
+        return removed
+
+    async def _drop_expired_partitions(self, cutoff: datetime) -> int:
+        """Detach and drop expired partitions, returning the rows removed"""
+        async with async_engine.connect() as conn:
+            if not await conn.run_sync(is_partitioned):
+                return 0
+            partitions = await conn.run_sync(list_partitions)
+            concurrent = conn.dialect.server_version_info >= (14,)
+
+        removed = 0
+        for name, month in partitions:
+            if add_months(month, 1) > cutoff:
+                break
+            async with async_engine.connect() as conn:
+                # Planner statistics are close enough for the metric
+                rows = (await conn.execute(text(
+                    "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = :name"
+                ), {"name": name})).scalar() or 0
+                user_ids = (await conn.execute(text(PARTITION_USERS.format(name=name)))).scalars().all()
+            # Mark first so a failed drop cannot lose the users
+            await self.dirty_users.mark(user_ids)
+
+            if not await self._detach_partition(name, concurrent):
+                continue
+            # Once detached the drop no longer touches the parent table
+            async with async_engine.begin() as conn:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            RETENTION_ROWS_REMOVED.labels(engagement_type="all", method="partition").inc(rows)
+            log_info(f"Retention dropped partition {name}")
+            removed += rows
+        return removed
+
+    async def _detach_partition(self, name: str, concurrent: bool) -> bool:
+        """Detach a partition without stalling queries on the parent table.
+
+        Postgres 14+ detaches concurrently. Older servers need an exclusive
+        lock on the parent; it is held only for the catalog update, and the
+        lock timeout stops the request queueing every engagement query behind
+        a long-running one. A partition that cannot be detached is left for
+        the next run.
+        """
+        try:
+            if concurrent:
+                async with async_engine.connect() as conn:
+                    # CONCURRENTLY cannot run inside a transaction block
+                    conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name} CONCURRENTLY"))
+            else:
+                async with async_engine.begin() as conn:
+                    await conn.execute(text(f"SET LOCAL lock_timeout = '{self.detach_lock_timeout}s'"))
+                    await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            return True
+        except DBAPIError as e:
+            log_error(e, f"Retention could not detach partition {name}; retrying next run")
+            return False
+
+    async def _delete_in_batches(self, type_filter, cutoff: datetime, label: str) -> int:
+        removed = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                batch = select(Engagement.id).where(
+                    type_filter,
+                    Engagement.created_at < cutoff
+                ).limit(self.batch_size).scalar_subquery()
+                user_ids = (await db.execute(
+                    delete(Engagement).where(Engagement.id.in_(batch)).returning(Engagement.user_id),
+                    execution_options={"synchronize_session": False}
+                )).scalars().all()
+                await db.commit()
+
+            await self.dirty_users.mark(set(user_ids))
+            RETENTION_ROWS_REMOVED.labels(engagement_type=label, method="batch").inc(len(user_ids))
+            removed += len(user_ids)
+            if len(user_ids) < self.batch_size:
+                return removed
+            await asyncio.sleep(self.batch_pause)
@@ -1,21 +1,35 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from core.pult.processor import PULTProcessor
+from core.pult.workers import score_shard
+from core.pult.dirty import DirtyUserSet, rolled_over_user_ids
 from core.websocket.handler import WebSocketManager
-from models.user import User
-from models.engagement import Engagement
+from database import AsyncSessionLocal, async_engine
 from core.logger import log_info, log_error
 from core.monitoring.metrics import BACKGROUND_TASKS, PROCESSING_TIME
+from core.analytics.rollups import AnalyticsRollup
+from core.partitioning.engagements import maintain_partitions
+from core.retention.engine import RetentionEngine
+from core.cache.redis import RedisCache
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import asyncio
 import time
+import os
 
 class TaskScheduler:
-    def __init__(self, db: Session, websocket_manager: WebSocketManager):
+    def __init__(self, websocket_manager: WebSocketManager, cache: RedisCache = None):
         self.scheduler = AsyncIOScheduler()
-        self.db = db
         self.websocket_manager = websocket_manager
-        self.pult_processor = PULTProcessor(db)
+        self.cache = cache
+        self.dirty_users = DirtyUserSet()
+        
+        # Scoring runs in worker processes so it never blocks the event loop.
+        # The pool is started by the first run that wins the claim, so
+        # workers that never score do not spawn processes.
+        self.pult_workers = int(os.getenv("PULT_WORKERS", os.cpu_count() or 1))
+        self.pult_shards = int(os.getenv("PULT_SHARDS", self.pult_workers))
+        self.executor: ProcessPoolExecutor = None
         
     def start(self):
         """Start the scheduler"""
@@ -43,33 +57,91 @@ class TaskScheduler:
         self.scheduler.start()
         log_info("Task scheduler started")
         
+    def shutdown(self):
+        """Stop the scheduler and its scoring workers"""
+        self.scheduler.shutdown()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        
     async def update_pult_scores(self):
-        """Update PULT scores for all users"""
+        """Rescore users with new engagements or engagements changing time period"""
+        token = None
         try:
+            claim = await self.dirty_users.claim()
+            if claim is None:
+                log_info("PULT scoring already running elsewhere, skipping")
+                return
+            token, dirty_user_ids, last_run = claim
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.pult_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            
             start_time = time.time()
-            users = self.db.query(User).all()
+            now = datetime.utcnow()
+            async with AsyncSessionLocal() as db:
+                rolled_over = await rolled_over_user_ids(
+                    db, last_run or now - timedelta(hours=1), now
+                )
+            user_ids = sorted(set(dirty_user_ids) | set(rolled_over))
+            log_info(
+                f"Rescoring {len(user_ids)} users "
+                f"({len(dirty_user_ids)} dirty, {len(rolled_over)} rolled over)"
+            )
+            
+            loop = asyncio.get_running_loop()
+            shards = [
+                loop.run_in_executor(
+                    self.executor,
+                    score_shard,
+                    shard,
+                    self.pult_shards,
+                    [user_id for user_id in user_ids if user_id % self.pult_shards == shard]
+                )
+                for shard in range(self.pult_shards)
+            ]
             
-            for user in users:
+            scored = []
+            completed = 0
+            for next_shard in asyncio.as_completed(shards):
                 try:
-                    score = self.pult_processor.process_user_data(user.id)
-                    await self.websocket_manager.send_update(
-                        user.id,
-                        {
-                            "type": "score_update",
-                            "score": score,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    )
-                    BACKGROUND_TASKS.labels(
-                        task_type="pult_update",
-                        status="success"
-                    ).inc()
+                    shard, shard_user_ids, changed, elapsed = await next_shard
                 except Exception as e:
-                    log_error(e, f"Error updating PULT score for user {user.id}")
+                    log_error(e, "Error scoring PULT shard")
                     BACKGROUND_TASKS.labels(
                         task_type="pult_update",
                         status="error"
                     ).inc()
+                    continue
+                
+                completed += 1
+                scored.extend(shard_user_ids)
+                PROCESSING_TIME.labels(task_type="pult_update_shard").observe(elapsed)
+                BACKGROUND_TASKS.labels(
+                    task_type="pult_update",
+                    status="success"
+                ).inc(len(shard_user_ids))
+                log_info(
+                    f"PULT shard {shard} scored {len(shard_user_ids)} users, "
+                    f"{len(changed)} changed, in {elapsed:.2f}s "
+                    f"({completed}/{self.pult_shards} shards done)"
+                )
+                
+                # Unchanged scores are not broadcast
+                timestamp = datetime.utcnow().isoformat()
+                try:
+                    await self.websocket_manager.broadcast_many(
+                        (user_id, {"type": "score_update", "score": score, "timestamp": timestamp})
+                        for user_id, score in changed.items()
+                    )
+                except Exception as e:
+                    log_error(e, f"Error sending PULT score updates for shard {shard}")
+            
+            # Dirty users in failed shards stay claimed; rolled over ones
+            # are marked so the next run retries them too
+            await self.dirty_users.mark(set(rolled_over) - set(scored))
+            await self.dirty_users.complete(token, scored, now)
             
             PROCESSING_TIME.labels(task_type="pult_update").observe(
                 time.time() - start_time
@@ -77,15 +149,26 @@ class TaskScheduler:
             
         except Exception as e:
             log_error(e, "Error in PULT score update job")
+            BACKGROUND_TASKS.labels(
+                task_type="pult_update",
+                status="error"
+            ).inc()
+            if token:
+                # Claimed users stay put for the next run
+                await self.dirty_users.release(token)
     
     async def cleanup_old_data(self):
         """Clean up old engagement data"""
         try:
-            cutoff_date = datetime.utcnow() - timedelta(days=90)
-            self.db.query(Engagement).filter(
-                Engagement.created_at < cutoff_date
-            ).delete()
-            self.db.commit()
+            # Create upcoming monthly partitions before rows arrive for them
+            async with async_engine.begin() as conn:
+                await conn.run_sync(maintain_partitions)
+            
+            # Drop expired partitions and delete the rest in batches
+            retention = RetentionEngine(self.dirty_users)
+            await retention.run()
+            async with AsyncSessionLocal() as db:
+                await AnalyticsRollup(db).clip_expired(retention.default_days, retention.days_by_type)
             
             BACKGROUND_TASKS.labels(
                 task_type="cleanup",
@@ -103,23 +186,25 @@ class TaskScheduler:
         """Aggregate analytics data"""
         try:
             start_time = time.time()
-            # Aggregate engagement data
-            analytics = self.db.query(
-                Engagement.engagement_type,
-                func.count(Engagement.id)
-            ).group_by(
-                Engagement.engagement_type
-            ).all()
+            async with AsyncSessionLocal() as db:
+                rollup = AnalyticsRollup(db)
+                
+                # Fold new engagements into the hourly and daily rollups
+                await rollup.update_rollups()
+                await rollup.snapshot_scores()
+                
+                analytics = await rollup.engagement_distribution()
             
             # Cache results
-            await cache.set(
-                "analytics_summary",
-                {
-                    "data": dict(analytics),
-                    "updated_at": datetime.utcnow().isoformat()
-                },
-                expire_minutes=15
-            )
+            if self.cache:
+                await self.cache.set(
+                    "analytics_summary",
+                    {
+                        "data": analytics,
+                        "updated_at": datetime.utcnow().isoformat()
+                    },
+                    expire_minutes=15
+                )
             
             PROCESSING_TIME.labels(task_type="analytics").observe(
                 time.time() - start_time
@@ -0,0 +1,128 @@
+from redis.asyncio import Redis
+from typing import Awaitable, Callable, Dict, List, Tuple
+from core.logger import log_error
+import asyncio
+import json
+import os
+
+# Called with (user_id, data) for every message to a user with local sockets
+DeliveryHandler = Callable[[int, dict], Awaitable[None]]
+
+class RedisBroker:
+    """Fan WebSocket messages out to every API worker over Redis pub/sub.
+
+    Users are hashed onto a fixed number of channels. A worker subscribes to
+    a channel while it holds a socket for any user on it and drops messages
+    for users it has no socket for.
+    """
+    def __init__(self, redis: Redis = None, shards: int = None):
+        self.redis = redis or Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=0,
+            decode_responses=True,
+            socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0)),
+            health_check_interval=30
+        )
+        self.shards = shards or int(os.getenv("WEBSOCKET_BROKER_SHARDS", 64))
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.handler: DeliveryHandler = None
+        self.listener: asyncio.Task = None
+        # Local users per channel, so a channel is dropped with its last user
+        self.channel_users: Dict[str, int] = {}
+
+    def channel(self, user_id: int) -> str:
+        return f"pult:ws:{user_id % self.shards}"
+
+    async def start(self, handler: DeliveryHandler):
+        """Start delivering subscribed messages to handler"""
+        self.handler = handler
+        self.listener = asyncio.ensure_future(self._listen())
+
+    async def subscribe(self, user_id: int):
+        """Receive messages for a user with a socket on this worker"""
+        channel = self.channel(user_id)
+        self.channel_users[channel] = self.channel_users.get(channel, 0) + 1
+        if self.channel_users[channel] == 1:
+            await self.pubsub.subscribe(channel)
+
+    async def unsubscribe(self, user_id: int):
+        """Stop receiving messages for a user whose last local socket closed"""
+        channel = self.channel(user_id)
+        self.channel_users[channel] -= 1
+        if not self.channel_users[channel]:
+            del self.channel_users[channel]
+            await self.pubsub.unsubscribe(channel)
+
+    async def publish(self, user_id: int, data: dict):
+        """Send a message to the user's sockets on whichever worker holds them"""
+        await self.redis.publish(
+            self.channel(user_id),
+            json.dumps({"user_id": user_id, "data": data})
+        )
+
+    async def publish_many(self, updates: List[Tuple[int, dict]]):
+        """Publish many messages in one pipelined round trip"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id, data in updates:
+                pipe.publish(
+                    self.channel(user_id),
+                    json.dumps({"user_id": user_id, "data": data})
+                )
+            await pipe.execute()
+
+    async def _listen(self):
+        while True:
+            try:
+                if not self.pubsub.subscribed:
+                    await asyncio.sleep(0.1)
+                    continue
+                message = await self.pubsub.get_message(timeout=1.0)
+                if message:
+                    payload = json.loads(message["data"])
+                    await self.handler(payload["user_id"], payload["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_error(e, "WebSocket broker delivery failed")
+                await asyncio.sleep(1)
+
+    async def close(self):
+        """Stop listening and close the Redis connections"""
+        if self.listener:
+            self.listener.cancel()
+        await self.pubsub.aclose()
+        await self.redis.aclose()
+
+class LocalBroker:
+    """In-process broker for tests and single-worker development.
+
+    Managers given the same `bus` behave like API workers sharing Redis.
+    """
+    def __init__(self, bus: Dict[int, List[DeliveryHandler]] = None):
+        self.bus = bus if bus is not None else {}
+        self.handler: DeliveryHandler = None
+
+    async def start(self, handler: DeliveryHandler):
+        self.handler = handler
+
+    async def subscribe(self, user_id: int):
+        self.bus.setdefault(user_id, []).append(self.handler)
+
+    async def unsubscribe(self, user_id: int):
+        self.bus[user_id].remove(self.handler)
+        if not self.bus[user_id]:
+            del self.bus[user_id]
+
+    async def publish(self, user_id: int, data: dict):
+        # Round trip through JSON like messages sent over Redis
+        data = json.loads(json.dumps(data))
+        for handler in list(self.bus.get(user_id, [])):
+            await handler(user_id, data)
+
+    async def publish_many(self, updates: List[Tuple[int, dict]]):
+        for user_id, data in updates:
+            await self.publish(user_id, data)
+
+    async def close(self):
+        """Nothing to release"""
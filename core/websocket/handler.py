@@ -1,26 +1,203 @@
 from fastapi import WebSocket
-from typing import Dict, List
-import json
-from core.logger import log_info
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+import asyncio
+import time
+import os
+from core.logger import log_info, log_error
+from core.monitoring.metrics import (
+    WEBSOCKET_CONNECTIONS, WEBSOCKET_MESSAGES, WEBSOCKET_DROPPED, WEBSOCKET_SEND_QUEUE_DEPTH
+)
+from core.websocket.broker import LocalBroker, RedisBroker
+
+# Message types where only the newest unsent one matters
+COALESCED_TYPES = {"score_update", "ping"}
+
+# What to do when a client's send queue is full
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+# Close code telling a slow client to reconnect later
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+# Close code for clients that stopped answering pings
+IDLE_CLOSE_CODE = 4008
+
+class ClientConnection:
+    """A socket with a bounded send queue drained by its own writer task.
+
+    Queued messages of a coalesced type are replaced by newer ones, so a
+    client that falls behind only ever receives its latest score.
+    """
+    def __init__(self, websocket: WebSocket, max_queue: int, policy: str, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue = deque()
+        # Newest unsent message per coalesced type; the queue holds its type
+        self.latest: Dict[str, dict] = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self.writer = asyncio.ensure_future(self._write())
+
+    def enqueue(self, data: dict):
+        """Queue a message without waiting for the client"""
+        if self.closed:
+            return
+        message_type = data.get("type")
+        if message_type in COALESCED_TYPES:
+            if message_type in self.latest:
+                self.latest[message_type] = data
+                WEBSOCKET_DROPPED.labels(reason="coalesced").inc()
+                return
+            self.latest[message_type] = data
+            item = message_type
+        else:
+            item = data
+
+        if len(self.queue) >= self.max_queue:
+            if self.policy == DISCONNECT:
+                WEBSOCKET_DROPPED.labels(reason="slow_client").inc(len(self.queue) + 1)
+                asyncio.ensure_future(self.close(SLOW_CLIENT_CLOSE_CODE))
+                return
+            self._take(self.queue.popleft())
+            WEBSOCKET_DROPPED.labels(reason="queue_full").inc()
+
+        self.queue.append(item)
+        self.ready.set()
+
+    def _take(self, item) -> dict:
+        """Resolve a queued item to the message to send"""
+        if isinstance(item, str):
+            return self.latest.pop(item)
+        return item
+
+    async def _write(self):
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                while self.queue and not self.closed:
+                    data = self._take(self.queue.popleft())
+                    await asyncio.wait_for(self.websocket.send_json(data), self.send_timeout)
+                    WEBSOCKET_MESSAGES.labels(direction="out", type=data.get("type", "unknown")).inc()
+                self.ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Dead or stuck socket; the endpoint's receive loop cleans up
+            log_error(e, "WebSocket send failed")
+            await self.close(SLOW_CLIENT_CLOSE_CODE)
+
+    async def close(self, code: int = 1000):
+        """Stop writing and close the socket"""
+        if self.closed:
+            return
+        self.closed = True
+        # Waking the writer lets it exit even if a cancel is swallowed by wait_for
+        self.ready.set()
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
 
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-        
+    def __init__(self, broker: RedisBroker = None):
+        self.active_connections: Dict[int, List[ClientConnection]] = {}
+        # Any worker publishes through the broker; the one holding the socket delivers
+        self.broker = broker or LocalBroker()
+        self.max_queue = int(os.getenv("WEBSOCKET_SEND_QUEUE_SIZE", 100))
+        self.policy = os.getenv("WEBSOCKET_SLOW_CLIENT_POLICY", DROP_OLDEST)
+        self.send_timeout = float(os.getenv("WEBSOCKET_SEND_TIMEOUT", 5))
+        # Paces queue-depth sampling and application pings; the same variable
+        # sets the server's protocol-level ping interval (core/websocket/worker.py)
+        self.ping_interval = float(os.getenv("WEBSOCKET_PING_INTERVAL", 20))
+        # Dead sockets are found by those protocol-level pings. Application
+        # pings and reaping are opt-in, as they drop clients that never send "pong".
+        self.idle_timeout = float(os.getenv("WEBSOCKET_IDLE_TIMEOUT", 0))
+        self.heartbeat: asyncio.Task = None
+
+    async def start(self):
+        """Start receiving broker messages for local sockets and pinging clients"""
+        await self.broker.start(self.deliver)
+        self.heartbeat = asyncio.ensure_future(self._heartbeat())
+
     async def connect(self, websocket: WebSocket, user_id: int):
         await websocket.accept()
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
+            await self.broker.subscribe(user_id)
+        self.active_connections[user_id].append(
+            ClientConnection(websocket, self.max_queue, self.policy, self.send_timeout)
+        )
+        WEBSOCKET_CONNECTIONS.inc()
         log_info(f"WebSocket connected for user {user_id}")
-        
+
     async def disconnect(self, websocket: WebSocket, user_id: int):
-        self.active_connections[user_id].remove(websocket)
-        if not self.active_connections[user_id]:
+        connections = self.active_connections.get(user_id, [])
+        for connection in [c for c in connections if c.websocket is websocket]:
+            connections.remove(connection)
+            WEBSOCKET_CONNECTIONS.dec()
+            await connection.close()
+        if user_id in self.active_connections and not connections:
             del self.active_connections[user_id]
+            await self.broker.unsubscribe(user_id)
         log_info(f"WebSocket disconnected for user {user_id}")
-        
+
+    def touch(self, websocket: WebSocket, user_id: int):
+        """Record that a client is alive; any message it sends counts"""
+        for connection in self.active_connections.get(user_id, []):
+            if connection.websocket is websocket:
+                connection.last_seen = time.monotonic()
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                await self.ping_and_reap()
+            except Exception as e:
+                log_error(e, "WebSocket heartbeat failed")
+
+    async def ping_and_reap(self):
+        """Record queue depths and, with an idle_timeout, ping clients and close silent ones"""
+        now = time.monotonic()
+        idle = []
+        for user_id, connections in self.active_connections.items():
+            for connection in connections:
+                if self.idle_timeout and now - connection.last_seen > self.idle_timeout:
+                    idle.append((connection.websocket, user_id))
+                    continue
+                WEBSOCKET_SEND_QUEUE_DEPTH.observe(len(connection.queue))
+                if self.idle_timeout:
+                    connection.enqueue({"type": "ping"})
+
+        for websocket, user_id in idle:
+            log_info(f"Closing idle WebSocket for user {user_id}")
+            for connection in self.active_connections.get(user_id, []):
+                if connection.websocket is websocket:
+                    await connection.close(IDLE_CLOSE_CODE)
+            await self.disconnect(websocket, user_id)
+
     async def send_update(self, user_id: int, data: dict):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                await connection.send_json(data)
\ No newline at end of file
+        """Send to the user's sockets on every worker"""
+        await self.broker.publish(user_id, data)
+
+    async def broadcast_many(self, updates: Iterable[Tuple[int, dict]]):
+        """Send many users their updates in one round trip to the broker"""
+        await self.broker.publish_many(list(updates))
+
+    async def deliver(self, user_id: int, data: dict):
+        """Queue for the user's sockets on this worker"""
+        for connection in self.active_connections.get(user_id, []):
+            connection.enqueue(data)
+
+    async def close(self):
+        if self.heartbeat:
+            self.heartbeat.cancel()
+        for connections in self.active_connections.values():
+            for connection in connections:
+                await connection.close(1001)
+        await self.broker.close()
@@ -0,0 +1,15 @@
+from uvicorn.workers import UvicornWorker
+import os
+
+class KeepaliveUvicornWorker(UvicornWorker):
+    """Uvicorn worker for gunicorn with configurable WebSocket keepalive.
+
+    Gunicorn does not pass uvicorn's command-line options through, so the
+    protocol-level ping interval and timeout are set here from the
+    environment. Sockets that stop answering pings are closed by the server.
+    """
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "ws_ping_interval": float(os.getenv("WEBSOCKET_PING_INTERVAL", 20)),
+        "ws_ping_timeout": float(os.getenv("WEBSOCKET_PING_TIMEOUT", 20))
+    }
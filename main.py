@@ -1,23 +1,28 @@
 from fastapi import FastAPI, HTTPException, Depends, Header, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 import tweepy
 import os
 from dotenv import load_dotenv
 from models.user import User
-from database import get_db
+from database import get_db, get_async_db, AsyncSessionLocal
 from services.enterprise.service import EnterpriseService
-from core.auth.middleware import AuthMiddleware
+from core.auth.middleware import AuthMiddleware, UserContext
 from core.errors.handlers import error_handler, APIError
 from core.logger import log_info, log_error
 from fastapi.openapi.utils import get_openapi
 from core.monitoring.metrics import MetricsMiddleware, PULT_SCORE_UPDATES, ENGAGEMENT_PROCESSED
 from prometheus_client import make_asgi_app
-from core.middleware.rate_limit import RateLimiter, RateLimitMiddleware
+from core.middleware.rate_limit import RateLimiter, RateLimitMiddleware, RedisRateLimitBackend
 from core.cache.redis import RedisCache
+from core.cache.tiered import TieredCache
 from schemas.base import UserResponse, EnterpriseData, WebSocketMessage
 from typing import List
 from core.scheduler.tasks import TaskScheduler
+from core.websocket.handler import WebSocketManager
+from core.websocket.broker import LocalBroker, RedisBroker
+from core.pult.processor import PULTProcessor
 
 load_dotenv()
 
@@ -59,11 +64,24 @@ app.add_middleware(MetricsMiddleware)
 app.mount("/metrics", metrics_app)
 
 # Initialize rate limiter and cache
-rate_limiter = RateLimiter(requests_per_minute=60)
-cache = RedisCache()
+rate_limiter = RateLimiter(requests_per_minute=60, backend=RedisRateLimitBackend())
+local_cache_size = int(os.getenv("LOCAL_CACHE_SIZE", 1024))
+cache = TieredCache(max_size=local_cache_size) if local_cache_size > 0 else RedisCache()
+
+# WebSocket updates reach sockets on any worker through Redis
+websocket_manager = WebSocketManager(
+    LocalBroker() if os.getenv("WEBSOCKET_BROKER") == "local" else RedisBroker()
+)
+
+# How long expired enterprise analytics may be served while refreshing
+ENTERPRISE_CACHE_STALE_MINUTES = int(os.getenv("ENTERPRISE_CACHE_STALE_MINUTES", 10))
 
 # Add rate limit middleware
-app.add_middleware(RateLimitMiddleware, rate_limiter=rate_limiter)
+app.add_middleware(
+    RateLimitMiddleware,
+    rate_limiter=rate_limiter,
+    tier_resolver=auth_handler.token_tier
+)
 
 # Initialize scheduler
 scheduler = None
@@ -93,7 +111,7 @@ def custom_openapi():
         
         ## Rate Limiting
         
-        API requests are limited to 60 requests per minute per client.
+        API requests are limited to 60 requests per minute per client, or 600 with an enterprise token.
         """,
         routes=app.routes,
     )
@@ -126,7 +144,7 @@ async def get_twitter_auth_url():
     return {"url": oauth2_user_handler.get_authorization_url()}
 
 @app.get("/api/auth/twitter/callback")
-async def twitter_callback(code: str, db: Session = Depends(get_db)):
+async def twitter_callback(code: str, db: AsyncSession = Depends(get_async_db)):
     """Handle Twitter OAuth callback"""
     try:
         log_info(f"Processing Twitter callback")
@@ -143,7 +161,10 @@ async def twitter_callback(code: str, db: Session = Depends(get_db)):
         twitter_user = client.get_me().data
         
         # Create or update user
-        user = db.query(User).filter(User.twitter_id == str(twitter_user.id)).first()
+        result = await db.execute(
+            select(User).where(User.twitter_id == str(twitter_user.id))
+        )
+        user = result.scalars().first()
         if not user:
             user = User(
                 twitter_id=str(twitter_user.id),
@@ -156,7 +177,7 @@ async def twitter_callback(code: str, db: Session = Depends(get_db)):
             user.access_token = tokens["access_token"]
             user.refresh_token = tokens.get("refresh_token")
         
-        db.commit()
+        await db.commit()
         
         # Create JWT token
         token = auth_handler.create_token(user.id, user.is_enterprise)
@@ -173,15 +194,18 @@ async def twitter_callback(code: str, db: Session = Depends(get_db)):
         raise
 
 @app.get("/api/user/me", response_model=UserResponse)
-async def get_user(token: str = Depends(auth_handler), db: Session = Depends(get_db)):
+async def get_user(context: UserContext = Depends(auth_handler.context), db: AsyncSession = Depends(get_async_db)):
     """Get current user info"""
-    user_id = auth_handler.get_user_id(token)
-    user = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).where(User.id == context.user_id))
+    user = result.scalars().first()
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-        
-    return user
+    
+    # Decay the stored score to now instead of waiting for the next batch run
+    response = UserResponse.from_orm(user)
+    response.pult_score = PULTProcessor(db).current_score(user)
+    return response
 
 @app.get(
     "/api/enterprise/data",
@@ -215,15 +239,14 @@ async def get_user(token: str = Depends(auth_handler), db: Session = Depends(get
 )
 async def get_enterprise_data(
     days: int = Field(30, ge=1, le=365),
-    token: str = Depends(auth_handler),
-    db: Session = Depends(get_db)
+    context: UserContext = Depends(auth_handler.context)
 ):
     """
     Get aggregated PULT analytics data for enterprise users.
     
     Args:
         days (int): Number of days to analyze (default: 30)
-        token (str): Enterprise API token
+        context (UserContext): Verified caller from the enterprise API token
         
     Returns:
         dict: Contains PULT trends and engagement distribution
@@ -231,23 +254,25 @@ async def get_enterprise_data(
     Raises:
         HTTPException: If token is invalid or user lacks enterprise access
     """
-    try:
-        # Check cache first
-        cache_key = f"enterprise_data_{days}"
-        cached_data = await cache.get(cache_key)
-        if cached_data:
-            return EnterpriseData(**cached_data)
-        
-        # Get fresh data
-        enterprise_service = EnterpriseService(db)
-        data = await enterprise_service.get_aggregated_data(days)
-        
-        # Cache the result
-        await cache.set(cache_key, data.dict(), expire_minutes=5)
+    async def load_enterprise_data():
+        # Uses its own session since stale refreshes outlive the request
+        async with AsyncSessionLocal() as db:
+            enterprise_service = EnterpriseService(db, cache)
+            data = await enterprise_service.get_aggregated_data(days)
         
         # Record metrics
         PULT_SCORE_UPDATES.inc()
         ENGAGEMENT_PROCESSED.inc(len(data.get("pult_trends", [])))
+        return data
+    
+    try:
+        # Concurrent misses share a single fill
+        data = await cache.get_or_set(
+            f"enterprise_data_{days}",
+            load_enterprise_data,
+            expire_minutes=5,
+            stale_minutes=ENTERPRISE_CACHE_STALE_MINUTES
+        )
         
         log_info("Enterprise data fetched successfully")
         return data
@@ -258,10 +283,10 @@ async def get_enterprise_data(
 @app.get("/api/enterprise/verify")
 async def verify_enterprise(
     token: str = Header(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Verify enterprise token"""
-    enterprise_service = EnterpriseService(db)
+    enterprise_service = EnterpriseService(db, cache)
     is_valid = await enterprise_service.verify_enterprise_access(token)
     
     return {
@@ -276,7 +301,9 @@ async def websocket_endpoint(
     token: str
 ):
     try:
-        if not auth_handler.verify_token(token):
+        # Sockets only carry updates for the token's own user
+        claims = auth_handler.verify_token(token)
+        if not claims or claims.get("user_id") != user_id:
             await websocket.close(code=4001)
             return
             
@@ -285,6 +312,9 @@ async def websocket_endpoint(
         try:
             while True:
                 data = await websocket.receive_json()
+                websocket_manager.touch(websocket, user_id)
+                if data.get("type") == "pong":
+                    continue
                 message = WebSocketMessage(**data)
                 
                 # Handle validated message
@@ -303,14 +333,18 @@ async def websocket_endpoint(
 @app.on_event("startup")
 async def startup_event():
     global scheduler, background_processor
+    await cache.start()
+    await websocket_manager.start()
     db = next(get_db())
     background_processor = BackgroundProcessor(db, websocket_manager)
     
     # Start scheduler
-    scheduler = TaskScheduler(db, websocket_manager)
+    scheduler = TaskScheduler(websocket_manager, cache)
     scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     if scheduler:
-        scheduler.scheduler.shutdown()
\ No newline at end of file
+        scheduler.shutdown()
+    await cache.close()
+    await websocket_manager.close()
\ No newline at end of file
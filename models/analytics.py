@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from .user import Base
+import datetime
+
+class EngagementRollup(Base):
+    __tablename__ = "engagement_rollups"
+    
+    granularity = Column(String, primary_key=True)  # hour, day
+    bucket_start = Column(DateTime, primary_key=True)
+    engagement_type = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ScoreSnapshot(Base):
+    __tablename__ = "pult_score_snapshots"
+    
+    day = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    pult_score = Column(Float)
+    last_processed = Column(DateTime)
+
+class RollupCheckpoint(Base):
+    __tablename__ = "rollup_checkpoints"
+    
+    name = Column(String, primary_key=True)
+    last_engagement_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from .user import Base
+import datetime
+
+class EnterpriseApiKey(Base):
+    __tablename__ = "enterprise_api_keys"
+    
+    id = Column(Integer, primary_key=True)
+    # HMAC-SHA256 of the key; the key itself is never stored
+    key_hash = Column(String(64), unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'))
+    name = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    revoked_at = Column(DateTime)
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .user import Base
 import datetime
 
 class Engagement(Base):
     __tablename__ = "engagements"
+    __table_args__ = (
+        Index('ix_engagements_user_id_created_at', 'user_id', 'created_at'),
+        Index('ix_engagements_created_at_engagement_type', 'created_at', 'engagement_type'),
+        UniqueConstraint('user_id', 'tweet_id', 'engagement_type', name='uq_engagements_user_tweet_type'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
@@ -1,5 +1,6 @@
 from sqlalchemy import Column, Integer, String, DateTime, JSON, Float, Boolean
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship
 import datetime
 
 Base = declarative_base()
@@ -15,5 +16,7 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     last_processed = Column(DateTime)
     engagement_data = Column(JSON)
+    collection_checkpoints = Column(JSON)  # since_id / pagination token per endpoint
     pult_score = Column(Float, default=0.0)
-    is_enterprise = Column(Boolean, default=False) 
\ No newline at end of file
+    is_enterprise = Column(Boolean, default=False) 
+    engagements = relationship("Engagement", back_populates="user")
\ No newline at end of file
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Issue, list and revoke enterprise API keys.
+
+Run from the app directory:
+
+    python -m scripts.enterprise_keys create --user-id 42 --name "Acme"
+    python -m scripts.enterprise_keys list
+    python -m scripts.enterprise_keys revoke 7
+"""
+from sqlalchemy import select
+from database import AsyncSessionLocal
+from models.api_key import EnterpriseApiKey
+from core.cache.tiered import TieredCache
+from services.enterprise.keys import EnterpriseKeyStore
+import argparse
+import asyncio
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def create_key(store: EnterpriseKeyStore, user_id: int, name: str):
+    key = await store.create(user_id=user_id, name=name)
+    # The key is only stored hashed, so this is the one chance to copy it
+    print(key)
+
+async def list_keys(store: EnterpriseKeyStore):
+    keys = (await store.db.execute(
+        select(EnterpriseApiKey).order_by(EnterpriseApiKey.id)
+    )).scalars()
+    for api_key in keys:
+        status = f"revoked {api_key.revoked_at.isoformat()}" if api_key.revoked_at else "active"
+        print(f"{api_key.id}\t{api_key.user_id}\t{api_key.name or ''}\t{api_key.created_at.isoformat()}\t{status}")
+
+async def revoke_key(store: EnterpriseKeyStore, key_id: int):
+    if not await store.revoke(key_id):
+        raise ValueError(f"No enterprise key with id {key_id}")
+    logger.info(f"Revoked enterprise key {key_id}")
+
+async def main(args):
+    # Deletes through the tiered cache reach every API worker's local copy
+    cache = TieredCache()
+    try:
+        async with AsyncSessionLocal() as db:
+            store = EnterpriseKeyStore(db, cache)
+            if args.command == "create":
+                await create_key(store, args.user_id, args.name)
+            elif args.command == "list":
+                await list_keys(store)
+            else:
+                await revoke_key(store, args.key_id)
+    finally:
+        await cache.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage enterprise API keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Issue a new key and print it")
+    create.add_argument("--user-id", type=int, required=True)
+    create.add_argument("--name")
+
+    commands.add_parser("list", help="List keys without revealing them")
+
+    revoke = commands.add_parser("revoke", help="Revoke a key by id")
+    revoke.add_argument("key_id", type=int)
+
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except Exception as e:
+        logger.error(f"Enterprise key command failed: {str(e)}")
+        exit(1)
@@ -1,36 +1,35 @@
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from models.user import User
-from models.engagement import Engagement
+from core.analytics.rollups import AnalyticsRollup
+from core.cache.redis import RedisCache
+from services.enterprise.keys import EnterpriseKeyStore
 from fastapi import HTTPException
 
 class EnterpriseService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, cache: RedisCache):
         self.db = db
+        # The app's shared cache, so key revocations reach every worker
+        self.cache = cache
     
     async def get_aggregated_data(self, days: int = 30):
         """Get aggregated PULT data for enterprise users"""
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
         # Get average PULT scores over time
-        pult_trends = self.db.query(
-            User.id,
-            User.pult_score,
-            User.last_processed
-        ).filter(
-            User.last_processed >= cutoff_date
-        ).all()
+        pult_trends = (await self.db.execute(
+            select(
+                User.id,
+                User.pult_score,
+                User.last_processed
+            ).where(
+                User.last_processed >= cutoff_date
+            )
+        )).all()
         
-        # Get engagement distributions
-        engagement_dist = self.db.query(
-            Engagement.engagement_type,
-            func.count(Engagement.id).label('count')
-        ).filter(
-            Engagement.created_at >= cutoff_date
-        ).group_by(
-            Engagement.engagement_type
-        ).all()
+        # Get engagement distributions from the pre-aggregated rollups
+        engagement_dist = await AnalyticsRollup(self.db).engagement_distribution(cutoff_date)
         
         return {
             "pult_trends": [
@@ -40,12 +39,9 @@ class EnterpriseService:
                     "timestamp": p[2].isoformat()
                 } for p in pult_trends
             ],
-            "engagement_distribution": {
-                e[0]: e[1] for e in engagement_dist
-            }
+            "engagement_distribution": engagement_dist
         }
     
     async def verify_enterprise_access(self, token: str):
         """Verify enterprise API token"""
-        # TODO: Implement proper token verification
-        return token == "test_enterprise_token" 
\ No newline at end of file
+        return await EnterpriseKeyStore(self.db, self.cache).verify(token) 
\ No newline at end of file
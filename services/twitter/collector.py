@@ -1,95 +1,253 @@
 from datetime import datetime, timedelta
-import tweepy
+from typing import Callable, List
+import asyncio
+import httpx
+import os
 from sqlalchemy.orm import Session
 from models.user import User
-from models.engagement import Engagement
 from core.pult.processor import PULTProcessor
+from core.queue.redis import RedisStreamQueue
+from core.logger import log_error
+from core.monitoring.metrics import TWITTER_API_CALLS
+from services.twitter.rate_limit import TwitterRateLimiter
+from services.twitter.ingest import engagement_batch, store_engagements
+
+TWITTER_API_URL = os.getenv("TWITTER_API_URL", "https://api.twitter.com/2")
+
+# How often a rate limited call is queued and retried before giving up
+RATE_LIMIT_RETRIES = 3
+
+# Checkpoint keys in User.collection_checkpoints
+LIKES_CHECKPOINT = "liked_tweets"
+TIMELINE_CHECKPOINT = "tweets"
 
 class TwitterDataCollector:
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        http_client: httpx.AsyncClient = None,
+        rate_limiter: TwitterRateLimiter = None,
+        queue: RedisStreamQueue = None,
+        session_factory: Callable[[], Session] = None
+    ):
         self.db = db
-        self.pult_processor = PULTProcessor(db)
+        # Sessions for users collected concurrently; defaults to SessionLocal
+        self.session_factory = session_factory
+        # With a queue, batches are stored and scored by engagement consumers
+        self.queue = queue
+        self.rate_limiter = rate_limiter or TwitterRateLimiter()
+        self.concurrency = int(os.getenv("TWITTER_COLLECT_CONCURRENCY", 20))
+        self.max_pages = int(os.getenv("TWITTER_MAX_PAGES", 5))
+        self.http_client = http_client or httpx.AsyncClient(
+            base_url=TWITTER_API_URL,
+            timeout=10.0,
+            limits=httpx.Limits(max_connections=self.concurrency * 2)
+        )
+        
+    async def close(self):
+        """Close the HTTP client"""
+        await self.http_client.aclose()
+        
+    async def collect_users(self, user_ids: List[int]):
+        """Collect data for many users concurrently, at most `concurrency` at a time.
+        
+        Users whose data is oldest are started first. Each user gets its own
+        session, so one user's database error cannot fail the rest.
+        """
+        session_factory = self.session_factory
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        user_ids = await asyncio.to_thread(lambda: [
+            row[0] for row in self.db.query(User.id).filter(
+                User.id.in_(user_ids)
+            ).order_by(
+                User.last_processed.asc().nullsfirst()
+            ).all()
+        ])
+        
+        async def collect(user_id: int):
+            async with semaphore:
+                db = session_factory()
+                try:
+                    return await self.collect_user_data(user_id, db)
+                except Exception as e:
+                    log_error(e, f"Collection failed for user {user_id}")
+                    return {"success": False, "user_id": user_id, "error": str(e)}
+                finally:
+                    await asyncio.to_thread(db.close)
         
-    async def collect_user_data(self, user_id: int):
-        """Collect and process user's Twitter data"""
-        user = self.db.query(User).filter(User.id == user_id).first()
+        return await asyncio.gather(*(collect(user_id) for user_id in user_ids))
+        
+    async def collect_user_data(self, user_id: int, db: Session = None):
+        """Collect and process user's Twitter data.
+        
+        Database work runs in a thread so it never blocks the event loop.
+        """
+        db = db or self.db
+        user = await asyncio.to_thread(
+            lambda: db.query(User).filter(User.id == user_id).first()
+        )
         if not user or not user.access_token:
             raise ValueError("User not found or not authenticated")
             
-        # Initialize Twitter client
-        client = tweepy.Client(user.access_token)
+        checkpoints = user.collection_checkpoints or {}
         
         try:
-            # Get user's recent likes
-            likes = await self._get_user_likes(client)
-            
-            # Get user's recent retweets
-            retweets = await self._get_user_retweets(client)
+            # Likes and the timeline are independent, so fetch them together
+            (likes, likes_checkpoint), (timeline, timeline_checkpoint) = await asyncio.gather(
+                self._get_user_likes(
+                    user.twitter_id, user.access_token, checkpoints.get(LIKES_CHECKPOINT, {})
+                ),
+                self._get_user_timeline(
+                    user.twitter_id, user.access_token, checkpoints.get(TIMELINE_CHECKPOINT, {})
+                )
+            )
             
-            # Get user's recent replies
-            replies = await self._get_user_replies(client)
+            # Retweets and replies both come from the same timeline page
+            retweets = self._get_user_retweets(timeline)
+            replies = self._get_user_replies(timeline)
             
-            # Process and store engagements
-            await self._store_engagements(user.id, likes, retweets, replies)
+            engagements = likes + retweets + replies
+            if self.queue:
+                message_id = await self.queue.publish(engagement_batch(user_id, engagements))
+                result = {"queued": True, "message_id": message_id}
+            else:
+                result = await asyncio.to_thread(self._store_and_score, db, user_id, engagements)
             
-            # Update PULT score
-            pult_score = self.pult_processor.process_user_data(user.id)
+            # Only advance checkpoints once the engagements are stored or queued
+            def save_checkpoints():
+                user.collection_checkpoints = {
+                    **checkpoints,
+                    LIKES_CHECKPOINT: likes_checkpoint,
+                    TIMELINE_CHECKPOINT: timeline_checkpoint
+                }
+                db.commit()
+            await asyncio.to_thread(save_checkpoints)
             
             return {
                 "success": True,
-                "engagements_processed": len(likes) + len(retweets) + len(replies),
-                "pult_score": pult_score
+                "engagements_processed": len(engagements),
+                **result
             }
             
         except Exception as e:
+            # Leave the session usable for whoever shares it
+            await asyncio.to_thread(db.rollback)
             raise ValueError(f"Error collecting Twitter data: {str(e)}")
     
-    async def _get_user_likes(self, client):
-        """Fetch user's recent likes"""
-        try:
-            likes = client.get_liked_tweets(max_results=100)
-            return [{"id": tweet.id, "type": "like", "created_at": tweet.created_at} 
-                   for tweet in (likes.data or [])]
-        except:
-            return []
-    
-    async def _get_user_retweets(self, client):
-        """Fetch user's recent retweets"""
-        try:
-            # Get user's tweets that are retweets
-            tweets = client.get_users_tweets(max_results=100)
-            retweets = [tweet for tweet in (tweets.data or []) if hasattr(tweet, 'referenced_tweets')]
-            return [{"id": tweet.id, "type": "retweet", "created_at": tweet.created_at} 
-                   for tweet in retweets]
-        except:
-            return []
+    def _store_and_score(self, db: Session, user_id: int, engagements: List[dict]) -> dict:
+        """Store engagements and fold them into the user's score"""
+        stored = store_engagements(db, user_id, engagements)
+        return {
+            "engagements_new": stored["inserted"],
+            "engagements_duplicate": stored["duplicates"],
+            "pult_score": PULTProcessor(db).process_user_data(user_id)
+        }
     
-    async def _get_user_replies(self, client):
-        """Fetch user's recent replies"""
-        try:
-            # Get user's tweets that are replies
-            tweets = client.get_users_tweets(max_results=100)
-            replies = [tweet for tweet in (tweets.data or []) if tweet.in_reply_to_user_id]
-            return [{"id": tweet.id, "type": "reply", "created_at": tweet.created_at} 
-                   for tweet in replies]
-        except:
-            return []
+    async def _get(self, endpoint: str, path: str, token: str, params: dict):
+        """GET a Twitter API v2 endpoint within its rate limit"""
+        headers = {"Authorization": f"Bearer {token}"}
+        for _ in range(RATE_LIMIT_RETRIES + 1):
+            await self.rate_limiter.acquire(token, endpoint)
+            response = await self.http_client.get(path, headers=headers, params=params)
+            
+            rate_limited = response.status_code == 429
+            self.rate_limiter.update(token, endpoint, response.headers, rate_limited)
+            TWITTER_API_CALLS.labels(endpoint=endpoint, status=response.status_code).inc()
+            if not rate_limited:
+                break
+        
+        response.raise_for_status()
+        return response.json()
     
-    async def _store_engagements(self, user_id: int, likes, retweets, replies):
-        """Store all engagements in database"""
-        all_engagements = []
+    async def _get_new_pages(self, endpoint: str, path: str, token: str, params: dict, checkpoint: dict):
+        """Fetch tweets newer than the checkpoint, newest first, up to max_pages.
         
-        # Process all engagement types
-        for engagement_list in [likes, retweets, replies]:
-            for eng in engagement_list:
-                engagement = Engagement(
-                    user_id=user_id,
-                    tweet_id=str(eng["id"]),
-                    engagement_type=eng["type"],
-                    created_at=eng["created_at"]
-                )
-                all_engagements.append(engagement)
+        A backlog that does not fit is resumed from its pagination token on
+        the next run; since_id only advances once the backlog is drained.
+        """
+        since_id = checkpoint.get("since_id")
+        pagination_token = checkpoint.get("pagination_token")
+        newest_id = checkpoint.get("pending_newest_id")
+        
+        # Likes have no since_id parameter, so stop at the first tweet already seen
+        supports_since_id = endpoint != LIKES_CHECKPOINT
+        params = dict(params)
+        if since_id and supports_since_id:
+            params["since_id"] = since_id
+        
+        tweets = []
+        for _ in range(self.max_pages):
+            if pagination_token:
+                params["pagination_token"] = pagination_token
+            body = await self._get(endpoint, path, token, params)
+            page = body.get("data", [])
+            if page and not newest_id:
+                newest_id = page[0]["id"]
+            
+            page_ids = [tweet["id"] for tweet in page]
+            if since_id and not supports_since_id and since_id in page_ids:
+                tweets.extend(page[:page_ids.index(since_id)])
+                pagination_token = None
+                break
+            
+            tweets.extend(page)
+            pagination_token = body.get("meta", {}).get("next_token")
+            if not pagination_token:
+                break
         
-        # Bulk insert engagements
-        self.db.bulk_save_objects(all_engagements)
-        self.db.commit() 
\ No newline at end of file
+        if pagination_token:
+            return tweets, {
+                "since_id": since_id,
+                "pending_newest_id": newest_id,
+                "pagination_token": pagination_token
+            }
+        return tweets, {"since_id": newest_id or since_id}
+    
+    def _parse_time(self, value: str):
+        if not value:
+            return None
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ")
+    
+    async def _get_user_likes(self, twitter_id: str, token: str, checkpoint: dict):
+        """Fetch user's likes since the checkpoint"""
+        likes, checkpoint = await self._get_new_pages(
+            LIKES_CHECKPOINT,
+            f"/users/{twitter_id}/liked_tweets",
+            token,
+            {"max_results": 100, "tweet.fields": "created_at"},
+            checkpoint
+        )
+        return [{"id": tweet["id"], "type": "like", "created_at": self._parse_time(tweet.get("created_at"))}
+               for tweet in likes], checkpoint
+    
+    async def _get_user_timeline(self, twitter_id: str, token: str, checkpoint: dict):
+        """Fetch user's tweets since the checkpoint"""
+        return await self._get_new_pages(
+            TIMELINE_CHECKPOINT,
+            f"/users/{twitter_id}/tweets",
+            token,
+            {
+                "max_results": 100,
+                "tweet.fields": "created_at,referenced_tweets,in_reply_to_user_id"
+            },
+            checkpoint
+        )
+    
+    def _get_user_retweets(self, timeline):
+        """Pick retweets out of the user's timeline"""
+        retweets = [
+            tweet for tweet in timeline
+            if any(ref.get("type") == "retweeted" for ref in tweet.get("referenced_tweets", []))
+        ]
+        return [{"id": tweet["id"], "type": "retweet", "created_at": self._parse_time(tweet.get("created_at"))}
+               for tweet in retweets]
+    
+    def _get_user_replies(self, timeline):
+        """Pick replies out of the user's timeline"""
+        replies = [tweet for tweet in timeline if tweet.get("in_reply_to_user_id")]
+        return [{"id": tweet["id"], "type": "reply", "created_at": self._parse_time(tweet.get("created_at"))}
+               for tweet in replies]
\ No newline at end of file
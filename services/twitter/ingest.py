@@ -0,0 +1,198 @@
+from datetime import datetime
+from typing import Callable, List
+import asyncio
+import signal
+import socket
+import os
+from prometheus_client import start_http_server
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from models.engagement import Engagement
+from core.pult.processor import PULTProcessor
+from core.pult.dirty import DirtyUserSet
+from core.queue.redis import RedisStreamQueue
+from core.logger import log_info, log_error
+from core.monitoring.metrics import QUEUE_MESSAGES, QUEUE_DEPTH, QUEUE_PENDING, QUEUE_LAG, PROCESSING_TIME
+
+# Stream collectors publish engagement batches to, and the group storing them
+ENGAGEMENT_STREAM = os.getenv("ENGAGEMENT_STREAM", "pult:engagements")
+ENGAGEMENT_GROUP = "engagement-ingest"
+
+# Rows per INSERT statement, well under Postgres' bind parameter limit
+STORE_BATCH_SIZE = 1000
+
+# Tweet ids are snowflakes: milliseconds since this epoch, shifted left 22 bits
+SNOWFLAKE_EPOCH_MS = 1288834974657
+
+def snowflake_time(tweet_id: str) -> datetime:
+    """When a tweet was posted, read from its id.
+
+    Truncated to whole seconds like the API's created_at, so a row stored
+    with either timestamp matches the other on conflict.
+    """
+    ms = (int(tweet_id) >> 22) + SNOWFLAKE_EPOCH_MS
+    return datetime.utcfromtimestamp(ms // 1000)
+
+def engagement_batch(user_id: int, engagements: List[dict]) -> dict:
+    """JSON-safe queue message for one user's collected engagements"""
+    return {
+        "user_id": user_id,
+        "engagements": [
+            {
+                "id": str(eng["id"]),
+                "type": eng["type"],
+                "created_at": eng["created_at"].isoformat() if eng["created_at"] else None
+            }
+            for eng in engagements
+        ]
+    }
+
+def store_engagements(db: Session, user_id: int, engagements: List[dict]) -> dict:
+    """Store engagements in database, skipping ones already stored.
+
+    New ones are also added to the user's decayed sums in the same commit.
+    """
+    rows = [
+        {
+            "user_id": user_id,
+            "tweet_id": str(eng["id"]),
+            "engagement_type": eng["type"],
+            # Scoring and partitioning both need a timestamp, and it must be
+            # the same on every collection for the unique key to match
+            "created_at": eng["created_at"] or snowflake_time(eng["id"])
+        }
+        for eng in engagements
+    ]
+
+    inserted = []
+    for start in range(0, len(rows), STORE_BATCH_SIZE):
+        # No conflict target, so this also matches the partitioned
+        # table's unique key that includes created_at
+        stmt = insert(Engagement).values(
+            rows[start:start + STORE_BATCH_SIZE]
+        ).on_conflict_do_nothing().returning(
+            Engagement.engagement_type,
+            Engagement.created_at,
+            Engagement.sentiment_score
+        )
+        inserted.extend(db.execute(stmt).fetchall())
+
+    # Only rows actually inserted are folded, so redelivery cannot count twice
+    PULTProcessor(db).fold_new_engagements(user_id, inserted)
+    db.commit()
+
+    return {
+        "inserted": len(inserted),
+        "duplicates": len(rows) - len(inserted)
+    }
+
+def ingest_batch(payload: dict) -> dict:
+    """Store a queued engagement batch; safe to run more than once for it"""
+    from database import SessionLocal
+
+    engagements = [
+        {
+            **eng,
+            "created_at": datetime.fromisoformat(eng["created_at"]) if eng["created_at"] else None
+        }
+        for eng in payload["engagements"]
+    ]
+
+    db = SessionLocal()
+    try:
+        return store_engagements(db, payload["user_id"], engagements)
+    finally:
+        db.close()
+
+class EngagementConsumer:
+    """Consume engagement batches from the queue, acking each once handled.
+
+    Users in handled batches are marked dirty before the ack, so the
+    scheduler rescores them on its next run.
+    """
+    def __init__(
+        self,
+        queue: RedisStreamQueue,
+        dirty_users: DirtyUserSet = None,
+        handler: Callable[[dict], dict] = ingest_batch,
+        name: str = None,
+        batch_size: int = None,
+        block_ms: int = 1000
+    ):
+        self.queue = queue
+        self.dirty_users = dirty_users
+        self.handler = handler
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or int(os.getenv("INGEST_BATCH_SIZE", 50))
+        self.block_ms = block_ms
+        self.stream = getattr(queue, "stream", "local")
+        self.running = False
+
+    async def run(self):
+        """Consume until stopped"""
+        await self.queue.ensure_group()
+        self.running = True
+        log_info(f"Engagement consumer {self.name} started")
+        while self.running:
+            try:
+                await self.process_once()
+            except Exception as e:
+                log_error(e, "Error reading engagement queue")
+                await asyncio.sleep(1)
+
+    def stop(self):
+        """Finish the current batch and stop"""
+        self.running = False
+
+    async def process_once(self) -> int:
+        """Handle one read of up to batch_size messages; returns how many were acked"""
+        messages = await self.queue.read(self.name, self.batch_size, self.block_ms)
+
+        handled = []
+        user_ids = set()
+        for message_id, payload in messages:
+            try:
+                with PROCESSING_TIME.labels(task_type="engagement_ingest").time():
+                    # Database work is blocking, keep it off the event loop
+                    await asyncio.to_thread(self.handler, payload)
+                handled.append(message_id)
+                user_ids.add(payload["user_id"])
+            except Exception as e:
+                # Left pending, so it is redelivered after the claim timeout
+                log_error(e, f"Error ingesting queue message {message_id}")
+                QUEUE_MESSAGES.labels(stream=self.stream, status="failed").inc()
+
+        # Mark even when nothing was new, in case an earlier delivery
+        # stored the batch but died before marking it
+        if self.dirty_users:
+            await self.dirty_users.mark(user_ids)
+        await self.queue.ack(handled)
+        await self.report_lag()
+        return len(handled)
+
+    async def report_lag(self):
+        """Publish queue depth and consumer lag"""
+        stats = await self.queue.stats()
+        QUEUE_DEPTH.labels(stream=self.stream).set(stats["depth"])
+        QUEUE_PENDING.labels(stream=self.stream).set(stats["pending"])
+        QUEUE_LAG.labels(stream=self.stream).set(stats["lag_seconds"])
+
+async def main():
+    """Run an engagement consumer until SIGINT or SIGTERM"""
+    start_http_server(int(os.getenv("INGEST_METRICS_PORT", 9101)))
+    queue = RedisStreamQueue(ENGAGEMENT_STREAM, ENGAGEMENT_GROUP)
+    dirty_users = DirtyUserSet()
+    consumer = EngagementConsumer(queue, dirty_users)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, consumer.stop)
+
+    try:
+        await consumer.run()
+    finally:
+        await queue.close()
+        await dirty_users.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+from typing import Dict, Tuple
+import asyncio
+import hashlib
+import time
+
+class RateLimitBucket:
+    def __init__(self, limit: int, window_seconds: int):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.remaining = limit
+        self.reset_at = time.time() + window_seconds
+
+class TwitterRateLimiter:
+    """Token buckets per (access token, endpoint) kept in step with Twitter's rate limit headers.
+
+    Calls wait for their bucket's window to reopen instead of failing, so
+    each window's quota is spent on calls that succeed.
+    """
+    def __init__(self, default_limit: int = 75, window_seconds: int = 900):
+        self.default_limit = default_limit
+        self.window_seconds = window_seconds
+        self.buckets: Dict[Tuple[str, str], RateLimitBucket] = {}
+
+    def _bucket(self, token: str, endpoint: str) -> RateLimitBucket:
+        # Key on a digest so raw access tokens are not kept around
+        key = (hashlib.sha256(token.encode()).hexdigest(), endpoint)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = RateLimitBucket(self.default_limit, self.window_seconds)
+            self.buckets[key] = bucket
+        return bucket
+
+    async def acquire(self, token: str, endpoint: str):
+        """Wait until a call to endpoint with token is allowed, then take it"""
+        bucket = self._bucket(token, endpoint)
+        while True:
+            now = time.time()
+            if now >= bucket.reset_at:
+                bucket.remaining = bucket.limit
+                bucket.reset_at = now + bucket.window_seconds
+            if bucket.remaining > 0:
+                bucket.remaining -= 1
+                return
+            await asyncio.sleep(bucket.reset_at - now)
+
+    def update(self, token: str, endpoint: str, headers, rate_limited: bool = False):
+        """Sync the bucket with the x-rate-limit-* headers of a response"""
+        bucket = self._bucket(token, endpoint)
+        if "x-rate-limit-limit" in headers:
+            bucket.limit = int(headers["x-rate-limit-limit"])
+        if "x-rate-limit-remaining" in headers:
+            bucket.remaining = int(headers["x-rate-limit-remaining"])
+        if "x-rate-limit-reset" in headers:
+            bucket.reset_at = float(headers["x-rate-limit-reset"])
+
+        if rate_limited:
+            bucket.remaining = 0
+            if "x-rate-limit-reset" not in headers:
+                bucket.reset_at = time.time() + bucket.window_seconds
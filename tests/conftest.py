@@ -0,0 +1,43 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from models.user import Base
+import models.engagement
+import models.analytics
+import models.api_key
+
+def sqlite_date_trunc(unit: str, value: str):
+    """Postgres' date_trunc for hour and day buckets"""
+    if value is None:
+        return None
+    timestamp = datetime.fromisoformat(value).replace(minute=0, second=0, microsecond=0)
+    if unit == "day":
+        timestamp = timestamp.replace(hour=0)
+    return timestamp.isoformat(" ")
+
+def add_postgres_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("date_trunc", 2, sqlite_date_trunc)
+
+@pytest.fixture
+def sqlite_session_factory():
+    """Sessions on an in-memory SQLite database with every table"""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    event.listen(engine, "connect", add_postgres_functions)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(engine, autoflush=False)
+    engine.dispose()
+
+@pytest_asyncio.fixture
+async def async_db():
+    """Async session on an in-memory SQLite database with every table"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    event.listen(engine.sync_engine, "connect", add_postgres_functions)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
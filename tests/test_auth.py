@@ -0,0 +1,46 @@
+import pytest
+import jwt
+from datetime import datetime, timedelta
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from core.auth.middleware import AuthMiddleware, UserContext
+
+@pytest.fixture
+def auth_handler():
+    return AuthMiddleware()
+
+def test_token_is_verified_once(auth_handler, monkeypatch):
+    token = auth_handler.create_token(user_id=5, is_enterprise=True)
+    decode = jwt.decode
+    calls = []
+    monkeypatch.setattr(jwt, "decode", lambda *args, **kwargs: calls.append(1) or decode(*args, **kwargs))
+
+    assert auth_handler.get_user_id(token) == 5
+    assert auth_handler.token_tier(token) == "enterprise"
+    assert auth_handler.verify_token(token)["user_id"] == 5
+    assert len(calls) == 1
+
+def test_invalid_and_expired_tokens_are_not_cached(auth_handler):
+    expired = jwt.encode(
+        {"user_id": 5, "exp": datetime.utcnow() - timedelta(seconds=1)},
+        auth_handler.secret_key,
+        algorithm="HS256"
+    )
+
+    assert auth_handler.verify_token(expired) is None
+    assert auth_handler.verify_token("not-a-token") is None
+    assert len(auth_handler.claims_cache) == 0
+
+def test_context_dependency(auth_handler):
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(context: UserContext = Depends(auth_handler.context)):
+        return {"user_id": context.user_id, "enterprise": context.is_enterprise}
+
+    client = TestClient(app)
+    token = auth_handler.create_token(user_id=9)
+
+    response = client.get("/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.json() == {"user_id": 9, "enterprise": False}
+    assert client.get("/me", headers={"Authorization": "Bearer nope"}).status_code == 403
@@ -0,0 +1,126 @@
+import pytest
+import asyncio
+import json
+from core.cache.local import LocalCache
+from core.cache.serializers import CacheSerializer
+from core.cache.redis import RedisCache
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_size=2)
+    cache.set("a", 1, ttl_seconds=60)
+    cache.set("b", 2, ttl_seconds=60)
+
+    # Touch "a" so "b" becomes the eviction candidate
+    assert cache.get("a") == 1
+    cache.set("c", 3, ttl_seconds=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+def test_local_cache_expires_entries():
+    cache = LocalCache()
+    cache.set("a", 1, ttl_seconds=0)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+@pytest.mark.parametrize("codec", ["json", "orjson", "msgpack"])
+def test_serializer_round_trip(codec):
+    pytest.importorskip(codec)
+    serializer = CacheSerializer(default_codec=codec, compress_threshold=0)
+    value = {"pult_trends": [{"user_id": 1, "score": 42.5}], "engagement_distribution": {"like": 3}}
+
+    assert serializer.loads(serializer.dumps("enterprise_data_30", value)) == value
+
+def test_serializer_picks_codec_by_prefix():
+    pytest.importorskip("msgpack")
+    serializer = CacheSerializer(prefix_codecs={"enterprise_": "msgpack", "enterprise_data_": "json"})
+
+    assert serializer.codec_for("enterprise_data_30") == "json"
+    assert serializer.codec_for("enterprise_other") == "msgpack"
+    assert serializer.codec_for("analytics_summary") == "json"
+
+def test_serializer_compresses_large_values():
+    pytest.importorskip("zstandard")
+    serializer = CacheSerializer(compress_threshold=100)
+    value = {"data": "x" * 10000}
+
+    raw = serializer.dumps("analytics_summary", value)
+
+    assert len(raw) < 1000
+    assert serializer.loads(raw) == value
+
+def test_serializer_reads_legacy_json():
+    serializer = CacheSerializer()
+
+    assert serializer.loads(json.dumps({"like": 3}).encode()) == {"like": 3}
+
+def shared_caches(count):
+    """Caches on separate workers sharing one fake Redis"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    caches = []
+    for _ in range(count):
+        cache = RedisCache()
+        cache.redis = fakeredis.FakeAsyncRedis(server=server)
+        cache.lock_poll_interval = 0.01
+        caches.append(cache)
+    return caches
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once_across_workers():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"score": 42}
+
+    values = await asyncio.gather(*(
+        cache.get_or_set("summary", loader)
+        for cache in shared_caches(2)
+        for _ in range(5)
+    ))
+
+    assert len(calls) == 1
+    assert values == [{"score": 42}] * 10
+
+@pytest.mark.asyncio
+async def test_stale_value_is_served_during_one_refresh():
+    cache, = shared_caches(1)
+    await cache.set("stale:summary", "old", 5)
+    release = asyncio.Event()
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await release.wait()
+        return "new"
+
+    assert await cache.get_or_set("summary", loader, stale_minutes=5) == "old"
+    assert await cache.get_or_set("summary", loader, stale_minutes=5) == "old"
+
+    release.set()
+    await asyncio.sleep(0.05)
+    assert len(calls) == 1
+    assert await cache.get_or_set("summary", loader, stale_minutes=5) == "new"
+
+@pytest.mark.asyncio
+async def test_failed_fill_releases_the_lock():
+    cache, = shared_caches(1)
+
+    async def failing_loader():
+        raise RuntimeError("database down")
+
+    async def loader():
+        return "value"
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_set("summary", failing_loader)
+
+    assert await cache.redis.get("lock:summary") is None
+    assert cache.fills == {}
+    assert await cache.get_or_set("summary", loader) == "value"
+
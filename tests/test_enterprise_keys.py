@@ -0,0 +1,99 @@
+import pytest
+import asyncio
+from sqlalchemy import event, select
+from core.cache.tiered import INVALIDATION_CHANNEL, TieredCache
+from models.api_key import EnterpriseApiKey
+from services.enterprise.keys import EnterpriseKeyStore, hash_key
+
+@pytest.fixture
+def server():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeServer()
+
+def tiered_cache(server):
+    """A worker's tiered cache on the shared fake Redis"""
+    import fakeredis
+    cache = TieredCache()
+    cache.redis = fakeredis.FakeAsyncRedis(server=server)
+    return cache
+
+def count_key_lookups(db):
+    """Count key lookups by hash, the query verify makes"""
+    lookups = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and "enterprise_api_keys.key_hash =" in statement:
+            lookups.append(statement)
+
+    event.listen(db.bind.sync_engine, "before_cursor_execute", before_cursor_execute)
+    return lookups
+
+async def invalidations(server):
+    """Subscribe to cache invalidations; returns a callable draining them"""
+    import fakeredis
+    pubsub = fakeredis.FakeAsyncRedis(server=server).pubsub()
+    await pubsub.subscribe(INVALIDATION_CHANNEL)
+    await pubsub.get_message(timeout=0.1)
+
+    async def drain():
+        keys = []
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.05)
+            if message is None:
+                return keys
+            keys.append(message["data"].decode().partition(":")[2])
+    return drain
+
+@pytest.mark.asyncio
+async def test_unknown_keys_are_negatively_cached(async_db, server, monkeypatch):
+    monkeypatch.setenv("ENTERPRISE_KEY_NEGATIVE_CACHE_SECONDS", "5")
+    cache = tiered_cache(server)
+    store = EnterpriseKeyStore(async_db, cache)
+    lookups = count_key_lookups(async_db)
+    published = await invalidations(server)
+
+    assert not await store.verify("guess")
+    assert not await store.verify("guess")
+    assert not await store.verify("")
+
+    assert len(lookups) == 1
+    assert 4000 < await cache.redis.pttl(f"enterprise_key:{hash_key('guess')}") <= 5000
+    # Caching a lookup does not make other workers drop theirs
+    assert await published() == []
+
+@pytest.mark.asyncio
+async def test_sub_second_ttl_is_clamped(async_db, server, monkeypatch):
+    monkeypatch.setenv("ENTERPRISE_KEY_NEGATIVE_CACHE_SECONDS", "0")
+    cache = tiered_cache(server)
+    store = EnterpriseKeyStore(async_db, cache)
+
+    assert not await store.verify("guess")
+    assert 0 < await cache.redis.pttl(f"enterprise_key:{hash_key('guess')}") <= 1000
+
+@pytest.mark.asyncio
+async def test_revoked_key_stops_verifying_on_every_worker(async_db, server):
+    worker_a, worker_b = tiered_cache(server), tiered_cache(server)
+    await worker_b.start()
+    store_a, store_b = EnterpriseKeyStore(async_db, worker_a), EnterpriseKeyStore(async_db, worker_b)
+    key = await store_a.create(name="Acme")
+    api_key_id = (await async_db.execute(select(EnterpriseApiKey.id))).scalar_one()
+    lookups = count_key_lookups(async_db)
+    published = await invalidations(server)
+
+    assert await store_a.verify(key)
+    assert await store_a.verify(key)
+    # The other worker reads the result from Redis into its local tier
+    assert await store_b.verify(key)
+    assert len(lookups) == 1
+    assert await published() == []
+
+    assert await store_a.revoke(api_key_id)
+    assert await published() == [f"enterprise_key:{hash_key(key)}"]
+
+    # Worker b dropped its local copy and looks the key up again
+    await asyncio.sleep(0.05)
+    assert not await store_b.verify(key)
+    assert len(lookups) == 2
+    assert not await store_a.revoke(api_key_id + 1)
+
+    await worker_b.close()
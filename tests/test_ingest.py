@@ -0,0 +1,161 @@
+import pytest
+import asyncio
+from datetime import datetime
+from sqlalchemy import text
+from core.queue.local import LocalStreamQueue
+from core.queue.redis import RedisStreamQueue, QueueFull
+from core.pult.dirty import DirtyUserSet
+from services.twitter.ingest import EngagementConsumer, engagement_batch, ingest_batch, snowflake_time
+from models.engagement import Engagement
+from models.user import User
+import database
+
+def batch(user_id):
+    return engagement_batch(user_id, [
+        {"id": 1, "type": "like", "created_at": datetime(2024, 1, 1)},
+        {"id": 2, "type": "reply", "created_at": None}
+    ])
+
+def test_engagement_batch_is_json_safe():
+    assert batch(7) == {
+        "user_id": 7,
+        "engagements": [
+            {"id": "1", "type": "like", "created_at": "2024-01-01T00:00:00"},
+            {"id": "2", "type": "reply", "created_at": None}
+        ]
+    }
+
+@pytest.mark.asyncio
+async def test_failed_messages_are_redelivered_then_dead_lettered():
+    queue = LocalStreamQueue(claim_idle_ms=0, max_deliveries=2)
+    await queue.publish(batch(1))
+    await queue.publish(batch(2))
+
+    handled = []
+
+    def handler(payload):
+        if payload["user_id"] == 2:
+            raise RuntimeError("database unavailable")
+        handled.append(payload["user_id"])
+
+    consumer = EngagementConsumer(queue, handler=handler, name="test", block_ms=0)
+
+    assert await consumer.process_once() == 1
+    assert await consumer.process_once() == 0
+    assert (await queue.stats())["pending"] == 1
+
+    # Second failure used up its deliveries, so the next read parks it
+    assert await consumer.process_once() == 0
+    assert handled == [1]
+    assert [payload["user_id"] for _, payload in queue.dead_letters] == [2]
+    assert (await queue.stats())["depth"] == 0
+
+@pytest.mark.asyncio
+async def test_publish_waits_for_consumers_to_drain():
+    queue = LocalStreamQueue(max_length=1, publish_timeout=1)
+    await queue.publish(batch(1))
+
+    publish = asyncio.ensure_future(queue.publish(batch(2)))
+    await asyncio.sleep(0.05)
+    assert not publish.done()
+
+    [(message_id, _)] = await queue.read("test", block_ms=0)
+    await queue.ack([message_id])
+    await asyncio.wait_for(publish, 1)
+    assert (await queue.stats())["depth"] == 1
+
+    queue.publish_timeout = 0
+    with pytest.raises(QueueFull):
+        await queue.publish(batch(3))
+
+@pytest.mark.asyncio
+async def test_redis_stream_queue_claims_unacked_messages():
+    fakeredis = pytest.importorskip("fakeredis")
+    queue = RedisStreamQueue(
+        "test:engagements", "test-group",
+        redis=fakeredis.FakeAsyncRedis(decode_responses=True),
+        claim_idle_ms=1
+    )
+    await queue.ensure_group()
+    await queue.ensure_group()
+    await queue.publish(batch(1))
+
+    # The first consumer reads and dies without acking
+    [(message_id, payload)] = await queue.read("crashed", block_ms=10)
+    assert payload["user_id"] == 1
+
+    await asyncio.sleep(0.01)
+    assert await queue.read("survivor", block_ms=10) == [(message_id, payload)]
+
+    await queue.ack([message_id])
+    stats = await queue.stats()
+    assert stats["depth"] == 0
+    assert stats["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_consumer_marks_users_dirty_and_scoring_claims_them_once():
+    fakeredis = pytest.importorskip("fakeredis")
+    dirty_users = DirtyUserSet(redis=fakeredis.FakeAsyncRedis(decode_responses=True))
+    queue = LocalStreamQueue()
+    await queue.publish(batch(1))
+    await queue.publish(batch(2))
+    await queue.publish(batch(1))
+
+    consumer = EngagementConsumer(queue, dirty_users, handler=lambda payload: None, name="test", block_ms=0)
+    assert await consumer.process_once() == 3
+
+    token, user_ids, last_run = await dirty_users.claim()
+    assert user_ids == [1, 2]
+    assert last_run is None
+
+    # A second scheduler cannot claim while the first holds the lease
+    assert await dirty_users.claim() is None
+
+    # User 2's shard failed, so it is handed out again with new dirty users
+    run_at = datetime(2024, 1, 1)
+    await dirty_users.complete(token, [1], run_at)
+    await dirty_users.mark([3])
+
+    _, user_ids, last_run = await dirty_users.claim()
+    assert user_ids == [2, 3]
+    assert last_run == run_at
+
+def test_snowflake_time_matches_api_created_at():
+    # Posted 2019-06-04T23:12:08.000Z according to the API
+    assert snowflake_time("1136048014974423040") == datetime(2019, 6, 4, 23, 12, 8)
+    assert snowflake_time(1136048014974423040) == snowflake_time("1136048014974423040")
+
+def test_ingesting_a_batch_twice_stores_each_engagement_once(sqlite_session_factory, monkeypatch):
+    with sqlite_session_factory() as db:
+        # Unique key of the partitioned table, which includes created_at
+        db.execute(text("DROP TABLE engagements"))
+        db.execute(text("""
+            CREATE TABLE engagements (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                tweet_id VARCHAR,
+                engagement_type VARCHAR,
+                sentiment_score FLOAT,
+                created_at DATETIME NOT NULL,
+                UNIQUE (user_id, tweet_id, engagement_type, created_at)
+            )
+        """))
+        db.add(User(id=7, engagement_data={"decay": {"sums": [0, 0, 0], "totals": [0, 0, 0], "updated_at": 0}}))
+        db.commit()
+    monkeypatch.setattr(database, "SessionLocal", sqlite_session_factory)
+
+    payload = engagement_batch(7, [
+        {"id": 1750000000000000000, "type": "like", "created_at": datetime(2025, 6, 1)},
+        {"id": 1750000000000000001, "type": "reply", "created_at": None}
+    ])
+    assert ingest_batch(payload) == {"inserted": 2, "duplicates": 0}
+    assert ingest_batch(payload) == {"inserted": 0, "duplicates": 2}
+
+    with sqlite_session_factory() as db:
+        rows = db.query(Engagement.tweet_id, Engagement.created_at).order_by(Engagement.tweet_id).all()
+        assert rows == [
+            ("1750000000000000000", datetime(2025, 6, 1)),
+            ("1750000000000000001", snowflake_time("1750000000000000001"))
+        ]
+        # Only the first delivery was folded into the decayed sums
+        assert sum(db.get(User, 7).engagement_data["decay"]["totals"]) == 2
@@ -88,7 +88,7 @@ async def test_enterprise_analytics(db: Session):
 @pytest.mark.asyncio
 async def test_scheduler(db: Session):
     """Test task scheduler"""
-    scheduler = TaskScheduler(db, websocket_manager)
+    scheduler = TaskScheduler(websocket_manager)
     scheduler.start()
     
     # Wait for initial tasks
@@ -0,0 +1,12 @@
+from datetime import datetime
+from core.partitioning.engagements import add_months, month_start, partition_name
+
+def test_month_arithmetic_crosses_years():
+    month = month_start(datetime(2024, 11, 17, 13, 5))
+
+    assert month == datetime(2024, 11, 1)
+    assert add_months(month, 2) == datetime(2025, 1, 1)
+    assert add_months(month, -11) == datetime(2023, 12, 1)
+
+def test_partition_name():
+    assert partition_name(datetime(2025, 3, 1)) == "engagements_2025_03"
@@ -0,0 +1,137 @@
+import pytest
+import numpy as np
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from core.pult.processor import PULTProcessor, TYPE_WEIGHTS
+
+@pytest.fixture
+def processor():
+    return PULTProcessor(db=None)
+
+def make_engagement(user_id, engagement_type, days_ago, sentiment_score=None):
+    return SimpleNamespace(
+        user_id=user_id,
+        engagement_type=engagement_type,
+        created_at=datetime.utcnow() - timedelta(days=days_ago, hours=12),
+        sentiment_score=sentiment_score
+    )
+
+def test_batch_tensors_match_single_user(processor):
+    engagements = [
+        make_engagement(1, "like", 0),
+        make_engagement(1, "retweet", 4, 0.5),
+        make_engagement(1, "reply", 40, -0.5),
+        make_engagement(3, "reply", 7),
+        make_engagement(3, "unknown", 1, 0.25),
+    ]
+    user_ids = np.array([1, 2, 3])
+    rows = [
+        (e.user_id, e.engagement_type, e.created_at, e.sentiment_score)
+        for e in engagements
+    ]
+
+    tensors = processor._create_engagement_tensors(user_ids, rows, datetime.utcnow())
+
+    assert tensors.shape == (3, 3, 10)
+    for i, user_id in enumerate(user_ids):
+        expected = processor._create_engagement_tensor(
+            [e for e in engagements if e.user_id == user_id]
+        )
+        np.testing.assert_allclose(tensors[i], expected)
+
+def test_batch_scores_match_single_user(processor):
+    rng = np.random.default_rng(0)
+    tensors = rng.uniform(0, 3, size=(5, 3, 10))
+
+    scores = processor._calculate_pult_scores(tensors)
+
+    for tensor, score in zip(tensors, scores):
+        assert score == pytest.approx(processor._calculate_pult_score(tensor))
+
+def test_decayed_score_tracks_bucketed_score(processor):
+    rng = np.random.default_rng(1)
+    now = datetime.utcnow()
+    engagements = [
+        make_engagement(1, rng.choice(["like", "retweet", "reply"]), int(rng.integers(0, 40)), float(rng.uniform(-0.5, 0.5)))
+        for _ in range(200)
+    ]
+
+    state = processor._fold_decayed(None, engagements, now)
+    tensor = processor._create_engagement_tensor(engagements)
+
+    # Compare before the 0-100 clamp, which both would hit here
+    bucketed = np.einsum('tk,t,k->', tensor, TYPE_WEIGHTS, np.exp(-np.arange(10) * 0.2))
+    assert bucketed * 10 > 100
+    assert processor._decayed_weight(state, now) == pytest.approx(bucketed, rel=0.03)
+
+def bucketed_weight(processor, engagements):
+    tensor = processor._create_engagement_tensor(engagements)
+    return np.einsum('tk,t,k->', tensor, TYPE_WEIGHTS, np.exp(-np.arange(10) * 0.2))
+
+def test_decayed_weight_error_bounds(processor):
+    now = datetime.utcnow()
+
+    # One engagement at every hour of age over 60 days
+    errors = []
+    for hours in range(1, 60 * 24):
+        engagement = SimpleNamespace(
+            engagement_type="reply", created_at=now - timedelta(hours=hours), sentiment_score=None
+        )
+        decayed = processor._decayed_weight(processor._fold_decayed(None, [engagement], now), now)
+        errors.append(decayed / bucketed_weight(processor, [engagement]) - 1)
+    assert -0.16 < min(errors) and max(errors) < 0.41
+
+    # Engagements bunched at the start or end of every period
+    for offset in (timedelta(hours=1), timedelta(days=2, hours=23)):
+        engagements = [
+            SimpleNamespace(engagement_type="reply", created_at=now - timedelta(days=3 * period) - offset, sentiment_score=None)
+            for period in range(10)
+        ]
+        decayed = processor._decayed_weight(processor._fold_decayed(None, engagements, now), now)
+        assert decayed == pytest.approx(bucketed_weight(processor, engagements), rel=0.11)
+
+def test_decayed_sums_advance_in_closed_form(processor):
+    now = datetime.utcnow()
+    old = [make_engagement(1, "like", 5), make_engagement(1, "reply", 3, 0.5)]
+    new = [make_engagement(1, "retweet", 0)]
+
+    # Folding in two steps matches folding everything at the later time
+    state = processor._fold_decayed(None, old, now - timedelta(days=2))
+    state = processor._fold_decayed(state, new, now)
+    expected = processor._fold_decayed(None, old + new, now)
+
+    np.testing.assert_allclose(state["sums"], expected["sums"])
+    np.testing.assert_allclose(state["totals"], expected["totals"])
+
+    # Reading later only decays the stored sums
+    later = now + timedelta(days=6)
+    assert processor._decayed_score(state, later) == pytest.approx(
+        processor._decayed_score(processor._fold_decayed(None, old + new, later), later)
+    )
+    assert processor._decayed_score(state, later) < processor._decayed_score(state, now)
+
+def test_current_score_prefers_newer_batch_score(processor):
+    now = datetime.utcnow()
+    state = processor._fold_decayed(None, [make_engagement(1, "reply", 3)], now - timedelta(hours=2))
+    user = SimpleNamespace(pult_score=55.0, engagement_data={"decay": state}, last_processed=now - timedelta(hours=2))
+
+    assert processor.current_score(user, now) == pytest.approx(processor._decayed_score(state, now))
+
+    # A batch run rescored the user after the sums were last updated
+    user.last_processed = now - timedelta(hours=1)
+    assert processor.current_score(user, now) == 55.0
+
+def test_batch_decayed_sums_match_fold(processor):
+    now = datetime.utcnow()
+    engagements = [
+        make_engagement(1, "like", 0),
+        make_engagement(1, "retweet", 4, 0.5),
+        make_engagement(3, "reply", 40, -0.5),
+    ]
+    rows = [(e.user_id, e.engagement_type, e.created_at, e.sentiment_score) for e in engagements]
+
+    sums = processor._create_decayed_sums(np.array([1, 2, 3]), rows, now)
+
+    np.testing.assert_allclose(sums[0], processor._fold_decayed(None, engagements[:2], now)["sums"])
+    np.testing.assert_allclose(sums[1], 0)
+    np.testing.assert_allclose(sums[2], processor._fold_decayed(None, engagements[2:], now)["sums"])
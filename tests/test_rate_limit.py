@@ -0,0 +1,58 @@
+import pytest
+from fastapi import HTTPException
+from core.middleware.rate_limit import LocalRateLimitBackend, RateLimiter, RedisRateLimitBackend
+
+@pytest.mark.asyncio
+async def test_burst_up_to_limit_then_retry_after_one_interval():
+    backend = LocalRateLimitBackend()
+
+    results = [await backend.allow("client", 6, 60000) for _ in range(7)]
+
+    assert [allowed for allowed, _ in results] == [True] * 6 + [False]
+    # One request's worth of quota frees up every 10 seconds
+    assert 9900 <= results[-1][1] <= 10000
+
+@pytest.mark.asyncio
+async def test_local_backend_evicts_least_recently_seen_clients():
+    backend = LocalRateLimitBackend(max_keys=2)
+    await backend.allow("a", 1, 60000)
+    await backend.allow("b", 1, 60000)
+    await backend.allow("c", 1, 60000)
+
+    assert list(backend.tats) == ["b", "c"]
+
+@pytest.mark.asyncio
+async def test_tier_and_route_limits():
+    limiter = RateLimiter(
+        requests_per_minute=1,
+        tier_limits={"enterprise": 3},
+        route_limits={"/api/enterprise/verify": 2}
+    )
+
+    for _ in range(3):
+        await limiter.check_rate_limit("partner", "enterprise", "/api/enterprise/data")
+    await limiter.check_rate_limit("free", "user", "/api/user/me")
+    with pytest.raises(HTTPException) as error:
+        await limiter.check_rate_limit("free", "user", "/api/user/me")
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "60"
+
+    # The route has its own budget, separate from the client's tier budget
+    for _ in range(2):
+        await limiter.check_rate_limit("free", "user", "/api/enterprise/verify")
+    with pytest.raises(HTTPException):
+        await limiter.check_rate_limit("free", "user", "/api/enterprise/verify")
+
+@pytest.mark.asyncio
+async def test_redis_backend_shares_limit_between_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    server = fakeredis.FakeServer()
+    worker_a = RedisRateLimitBackend(fakeredis.FakeAsyncRedis(server=server))
+    worker_b = RedisRateLimitBackend(fakeredis.FakeAsyncRedis(server=server))
+
+    assert (await worker_a.allow("client", 2, 60000))[0]
+    assert (await worker_b.allow("client", 2, 60000))[0]
+    allowed, retry_after = await worker_a.allow("client", 2, 60000)
+    assert not allowed
+    assert 29000 <= retry_after <= 30000
@@ -0,0 +1,95 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from core.analytics.rollups import AnalyticsRollup
+from models.engagement import Engagement
+from models.analytics import EngagementRollup
+
+def engagement(id, engagement_type, created_at):
+    return Engagement(
+        id=id, user_id=1, tweet_id=str(id), engagement_type=engagement_type, created_at=created_at
+    )
+
+async def rollup_counts(db, granularity):
+    rows = (await db.execute(
+        select(EngagementRollup.engagement_type, EngagementRollup.count).where(
+            EngagementRollup.granularity == granularity
+        )
+    )).all()
+    counts = {}
+    for engagement_type, count in rows:
+        counts[engagement_type] = counts.get(engagement_type, 0) + count
+    return counts
+
+@pytest.mark.asyncio
+async def test_watermark_waits_for_late_commits(async_db):
+    rollup = AnalyticsRollup(async_db)
+    rollup.settle_seconds = 0
+    now = datetime.utcnow()
+
+    # Id 2 was taken but has not committed yet
+    async_db.add_all([engagement(1, "like", now), engagement(3, "reply", now)])
+    await async_db.commit()
+
+    # The first run only starts the clock; new rows are counted from the table
+    assert await rollup.update_rollups() == 0
+    assert await rollup.engagement_distribution() == {"like": 1, "reply": 1}
+
+    # Id 2 commits before ids up to 3 have settled, so it is folded with them
+    async_db.add(engagement(2, "retweet", now))
+    await async_db.commit()
+    assert await rollup.update_rollups() == 3
+    assert await rollup_counts(async_db, "day") == {"like": 1, "reply": 1, "retweet": 1}
+    assert await rollup.engagement_distribution() == {"like": 1, "reply": 1, "retweet": 1}
+
+@pytest.mark.asyncio
+async def test_unsettled_ids_are_not_folded(async_db):
+    rollup = AnalyticsRollup(async_db)
+    rollup.settle_seconds = 300
+    now = datetime.utcnow()
+    async_db.add(engagement(1, "like", now))
+    await async_db.commit()
+
+    assert await rollup.update_rollups() == 0
+    assert await rollup.update_rollups() == 0
+    assert await rollup_counts(async_db, "day") == {}
+    assert await rollup.engagement_distribution() == {"like": 1}
+
+@pytest.mark.asyncio
+async def test_window_starts_at_the_cutoff_not_the_hour(async_db):
+    rollup = AnalyticsRollup(async_db)
+    rollup.settle_seconds = 0
+    cutoff = (datetime.utcnow() - timedelta(days=2)).replace(minute=30, second=0, microsecond=0)
+    async_db.add_all([
+        engagement(1, "like", cutoff - timedelta(minutes=15)),
+        engagement(2, "like", cutoff + timedelta(minutes=15)),
+        engagement(3, "like", cutoff + timedelta(hours=2)),
+        engagement(4, "like", cutoff + timedelta(days=1))
+    ])
+    await async_db.commit()
+    await rollup.update_rollups()
+    await rollup.update_rollups()
+
+    assert await rollup.engagement_distribution(cutoff) == {"like": 3}
+
+@pytest.mark.asyncio
+async def test_clip_expired_follows_retention_per_type(async_db):
+    rollup = AnalyticsRollup(async_db)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    for engagement_type, days in [("like", 20), ("like", 40), ("reply", 40), ("reply", 100), (None, 100)]:
+        async_db.add(EngagementRollup(
+            granularity="day",
+            bucket_start=today - timedelta(days=days),
+            engagement_type=engagement_type or "unknown",
+            count=1
+        ))
+    await async_db.commit()
+
+    await rollup.clip_expired(90, {"like": 30})
+
+    rows = (await async_db.execute(
+        select(EngagementRollup.engagement_type, EngagementRollup.bucket_start)
+    )).all()
+    assert sorted((engagement_type, (today - bucket_start).days) for engagement_type, bucket_start in rows) == [
+        ("like", 20), ("reply", 40)
+    ]
@@ -0,0 +1,103 @@
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from core.pult.dirty import CLAIMED_KEY, DIRTY_KEY, DirtyUserSet
+from core.pult.processor import PULTProcessor
+from core.pult.workers import score_shard
+from core.scheduler import tasks
+from core.scheduler.tasks import TaskScheduler
+from models.user import User
+import database
+
+class RecordingManager:
+    def __init__(self):
+        self.updates = []
+
+    async def broadcast_many(self, updates):
+        self.updates.extend(updates)
+
+@asynccontextmanager
+async def no_session():
+    yield None
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    scheduler = TaskScheduler(RecordingManager())
+    scheduler.dirty_users = DirtyUserSet(redis=fakeredis.FakeAsyncRedis(decode_responses=True))
+    scheduler.pult_shards = 2
+    monkeypatch.setattr(tasks, "AsyncSessionLocal", no_session)
+    yield scheduler
+    if scheduler.executor:
+        scheduler.executor.shutdown()
+
+def test_score_shard_selects_users_by_id_modulo(sqlite_session_factory, monkeypatch):
+    with sqlite_session_factory() as db:
+        db.add_all([
+            User(id=user_id, twitter_id=str(user_id), pult_score=50.0 if user_id == 4 else None)
+            for user_id in range(1, 8)
+        ])
+        db.commit()
+    monkeypatch.setattr(database, "SessionLocal", sqlite_session_factory)
+    # Batch scoring aggregates with Postgres-only functions
+    monkeypatch.setattr(
+        PULTProcessor, "process_users_batch",
+        lambda self, user_ids, aggregate_in_db=False: {user_id: 50.0 for user_id in user_ids}
+    )
+
+    shard, user_ids, changed, _ = score_shard(1, 3)
+
+    assert shard == 1
+    assert sorted(user_ids) == [1, 4, 7]
+    assert changed == {1: 50.0, 7: 50.0}
+
+@pytest.mark.asyncio
+async def test_failed_shard_is_retried_next_run(scheduler, monkeypatch):
+    scheduler.executor = ThreadPoolExecutor(max_workers=2)
+    failures = {0}
+    calls = []
+
+    def fake_score_shard(shard, shard_count, user_ids):
+        calls.append((shard, sorted(user_ids)))
+        if shard in failures:
+            failures.discard(shard)
+            raise RuntimeError("shard failed")
+        return shard, user_ids, {user_id: 10.0 for user_id in user_ids}, 0.0
+
+    rolled_over = [[4], []]
+
+    async def fake_rolled_over(db, since, now):
+        return rolled_over.pop(0)
+
+    monkeypatch.setattr(tasks, "score_shard", fake_score_shard)
+    monkeypatch.setattr(tasks, "rolled_over_user_ids", fake_rolled_over)
+    redis = scheduler.dirty_users.redis
+    await scheduler.dirty_users.mark([1, 2, 3])
+
+    await scheduler.update_pult_scores()
+
+    # Shard 0 failed: its dirty user stays claimed and its rolled over user is marked
+    assert sorted(calls) == [(0, [2, 4]), (1, [1, 3])]
+    assert await redis.smembers(CLAIMED_KEY) == {"2"}
+    assert await redis.smembers(DIRTY_KEY) == {"4"}
+    assert sorted(user_id for user_id, _ in scheduler.websocket_manager.updates) == [1, 3]
+
+    calls.clear()
+    await scheduler.update_pult_scores()
+
+    assert sorted(calls) == [(0, [2, 4]), (1, [])]
+    assert await redis.smembers(CLAIMED_KEY) == set()
+    assert await redis.smembers(DIRTY_KEY) == set()
+
+@pytest.mark.asyncio
+async def test_pool_starts_only_after_a_claim(scheduler, monkeypatch):
+    # Another worker holds the scoring lease
+    other = DirtyUserSet(redis=scheduler.dirty_users.redis)
+    token, _, _ = await other.claim()
+
+    scheduler.start()
+    await scheduler.update_pult_scores()
+    assert scheduler.executor is None
+    scheduler.shutdown()
+
+    await other.release(token)
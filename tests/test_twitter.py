@@ -0,0 +1,157 @@
+import pytest
+import httpx
+import time
+from types import SimpleNamespace
+from core.queue.local import LocalStreamQueue
+from services.twitter.collector import TwitterDataCollector, TWITTER_API_URL
+from services.twitter.rate_limit import TwitterRateLimiter
+
+def fake_twitter(handler):
+    """Collector talking to an in-process fake Twitter API"""
+    client = httpx.AsyncClient(base_url=TWITTER_API_URL, transport=httpx.MockTransport(handler))
+    return TwitterDataCollector(db=None, http_client=client, rate_limiter=TwitterRateLimiter())
+
+@pytest.mark.asyncio
+async def test_rate_limited_call_waits_for_window():
+    calls = []
+
+    def handler(request):
+        calls.append(time.time())
+        if len(calls) == 1:
+            return httpx.Response(429, headers={
+                "x-rate-limit-limit": "75",
+                "x-rate-limit-remaining": "0",
+                "x-rate-limit-reset": str(time.time() + 0.2)
+            })
+        return httpx.Response(200, json={"data": [{"id": "1", "created_at": "2024-01-01T00:00:00.000Z"}]})
+
+    collector = fake_twitter(handler)
+    likes, _ = await collector._get_user_likes("42", "token", {})
+
+    assert [like["id"] for like in likes] == ["1"]
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.15
+
+@pytest.mark.asyncio
+async def test_errors_are_not_swallowed():
+    collector = fake_twitter(lambda request: httpx.Response(401))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        await collector._get_user_timeline("42", "token", {})
+
+@pytest.mark.asyncio
+async def test_limiter_tracks_remaining_calls():
+    limiter = TwitterRateLimiter(default_limit=2, window_seconds=900)
+
+    await limiter.acquire("token", "tweets")
+    await limiter.acquire("token", "tweets")
+    limiter.update("token", "tweets", {"x-rate-limit-remaining": "5"})
+
+    assert limiter._bucket("token", "tweets").remaining == 5
+    assert limiter._bucket("other", "tweets").remaining == 2
+
+@pytest.mark.asyncio
+async def test_timeline_resumes_backlog_then_advances_since_id():
+    pages = {
+        None: {"data": [{"id": "30"}, {"id": "29"}], "meta": {"next_token": "p2"}},
+        "p2": {"data": [{"id": "28"}], "meta": {"next_token": "p3"}},
+        "p3": {"data": [{"id": "27"}], "meta": {}},
+    }
+    requests = []
+
+    def handler(request):
+        requests.append(dict(request.url.params))
+        return httpx.Response(200, json=pages[request.url.params.get("pagination_token")])
+
+    collector = fake_twitter(handler)
+    collector.max_pages = 2
+
+    tweets, checkpoint = await collector._get_user_timeline("42", "token", {"since_id": "20"})
+    assert [tweet["id"] for tweet in tweets] == ["30", "29", "28"]
+    assert checkpoint == {"since_id": "20", "pending_newest_id": "30", "pagination_token": "p3"}
+
+    tweets, checkpoint = await collector._get_user_timeline("42", "token", checkpoint)
+    assert [tweet["id"] for tweet in tweets] == ["27"]
+    assert checkpoint == {"since_id": "30"}
+    assert all(params["since_id"] == "20" for params in requests)
+
+@pytest.mark.asyncio
+async def test_likes_stop_at_last_seen_tweet():
+    def handler(request):
+        return httpx.Response(200, json={
+            "data": [{"id": "9"}, {"id": "7"}, {"id": "5"}],
+            "meta": {"next_token": "more"}
+        })
+
+    collector = fake_twitter(handler)
+
+    likes, checkpoint = await collector._get_user_likes("42", "token", {"since_id": "7"})
+
+    assert [like["id"] for like in likes] == ["9"]
+    assert checkpoint == {"since_id": "9"}
+
+class FakeSession:
+    """Just enough of a Session for collect_users"""
+    def __init__(self, rows=(), user=None, error=None):
+        self.rows = list(rows)
+        self.user = user
+        self.error = error
+        self.rolled_back = False
+        self.closed = False
+
+    def query(self, *args):
+        return self
+
+    def filter(self, *args):
+        return self
+
+    def order_by(self, *args):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def first(self):
+        if self.error:
+            raise self.error
+        return self.user
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_database_error_fails_only_its_user():
+    sessions = {}
+
+    def session_factory():
+        user_id = len(sessions) + 1
+        error = RuntimeError("connection reset") if user_id == 2 else None
+        user = SimpleNamespace(twitter_id=str(user_id), access_token="token", collection_checkpoints=None)
+        sessions[user_id] = FakeSession(user=user, error=error)
+        return sessions[user_id]
+
+    client = httpx.AsyncClient(
+        base_url=TWITTER_API_URL,
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"data": []}))
+    )
+    collector = TwitterDataCollector(
+        db=FakeSession(rows=[(1,), (2,), (3,)]),
+        http_client=client,
+        rate_limiter=TwitterRateLimiter(),
+        queue=LocalStreamQueue(),
+        session_factory=session_factory
+    )
+    collector.concurrency = 1
+
+    results = await collector.collect_users([1, 2, 3])
+
+    assert [result["success"] for result in results] == [True, False, True]
+    assert "connection reset" in results[1]["error"]
+    assert all(session.closed for session in sessions.values())
+
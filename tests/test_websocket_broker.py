@@ -0,0 +1,146 @@
+import pytest
+import asyncio
+from core.websocket.handler import WebSocketManager
+from core.websocket.broker import LocalBroker, RedisBroker
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+@pytest.mark.asyncio
+async def test_update_reaches_socket_on_another_worker():
+    bus = {}
+    worker_a = WebSocketManager(LocalBroker(bus))
+    worker_b = WebSocketManager(LocalBroker(bus))
+    await worker_a.start()
+    await worker_b.start()
+
+    socket = FakeSocket()
+    await worker_b.connect(socket, 7)
+
+    await worker_a.send_update(7, {"type": "score_update", "score": 42.0})
+    await worker_a.send_update(8, {"type": "score_update", "score": 1.0})
+    await asyncio.sleep(0.01)
+    assert socket.sent == [{"type": "score_update", "score": 42.0}]
+
+    await worker_b.disconnect(socket, 7)
+    await worker_a.send_update(7, {"type": "score_update", "score": 43.0})
+    assert len(socket.sent) == 1
+    assert bus == {}
+
+@pytest.mark.asyncio
+async def test_redis_broker_delivers_only_local_users():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    worker_a = WebSocketManager(RedisBroker(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), shards=4))
+    worker_b = WebSocketManager(RedisBroker(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), shards=4))
+    await worker_a.start()
+    await worker_b.start()
+
+    # Users 1 and 5 share a channel, but only user 1 has a socket
+    socket = FakeSocket()
+    await worker_b.connect(socket, 1)
+
+    await worker_a.send_update(5, {"score": 5.0})
+    await worker_a.send_update(1, {"score": 1.0})
+    for _ in range(50):
+        if socket.sent:
+            break
+        await asyncio.sleep(0.02)
+
+    assert socket.sent == [{"score": 1.0}]
+    await worker_a.close()
+    await worker_b.close()
+
+class SlowSocket(FakeSocket):
+    def __init__(self):
+        super().__init__()
+        self.unblock = asyncio.Event()
+        self.close_code = None
+
+    async def send_json(self, data):
+        await self.unblock.wait()
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+@pytest.mark.asyncio
+async def test_slow_client_gets_latest_score_without_stalling_others():
+    manager = WebSocketManager(LocalBroker())
+    await manager.start()
+    slow, fast = SlowSocket(), FakeSocket()
+    await manager.connect(slow, 1)
+    await manager.connect(fast, 2)
+
+    await manager.send_update(1, {"type": "score_update", "score": 0.0})
+    await asyncio.sleep(0.01)
+    await manager.broadcast_many(
+        [(1, {"type": "score_update", "score": float(score)}) for score in range(1, 5)]
+        + [(1, {"type": "notice", "text": "hi"}), (2, {"type": "score_update", "score": 9.0})]
+    )
+    await asyncio.sleep(0.01)
+    assert fast.sent == [{"type": "score_update", "score": 9.0}]
+
+    # The first score was already being sent; the rest coalesce into the newest
+    slow.unblock.set()
+    await asyncio.sleep(0.01)
+    assert slow.sent == [
+        {"type": "score_update", "score": 0.0},
+        {"type": "score_update", "score": 4.0},
+        {"type": "notice", "text": "hi"}
+    ]
+
+@pytest.mark.asyncio
+async def test_full_queue_disconnects_slow_client(monkeypatch):
+    monkeypatch.setenv("WEBSOCKET_SEND_QUEUE_SIZE", "2")
+    monkeypatch.setenv("WEBSOCKET_SLOW_CLIENT_POLICY", "disconnect")
+    manager = WebSocketManager(LocalBroker())
+    await manager.start()
+    slow = SlowSocket()
+    await manager.connect(slow, 1)
+
+    for n in range(4):
+        await manager.send_update(1, {"type": "notice", "n": n})
+    await asyncio.sleep(0.01)
+
+    assert slow.close_code == 1013
+
+@pytest.mark.asyncio
+async def test_silent_clients_are_reaped(monkeypatch):
+    monkeypatch.setenv("WEBSOCKET_IDLE_TIMEOUT", "0.05")
+    manager = WebSocketManager(LocalBroker())
+    await manager.start()
+    alive, silent = SlowSocket(), SlowSocket()
+    alive.unblock.set()
+    await manager.connect(alive, 1)
+    await manager.connect(silent, 2)
+
+    await asyncio.sleep(0.1)
+    manager.touch(alive, 1)
+    await manager.ping_and_reap()
+    await asyncio.sleep(0.01)
+
+    assert alive.sent == [{"type": "ping"}]
+    assert silent.close_code == 4008
+    assert list(manager.active_connections) == [1]
+
+@pytest.mark.asyncio
+async def test_receive_only_clients_are_kept_by_default():
+    manager = WebSocketManager(LocalBroker())
+    await manager.start()
+    socket = FakeSocket()
+    await manager.connect(socket, 1)
+
+    await manager.ping_and_reap()
+    await asyncio.sleep(0.01)
+
+    assert socket.sent == []
+    assert list(manager.active_connections) == [1]
+